@@ -3,8 +3,7 @@ import math
 import random
 import sys
 
-from entropy import vonNeumann
-from partial_trace import separate
+from entropy import vonNeumann, quantum_state
 from generate_random_quantum import *
 
 
@@ -72,25 +71,35 @@ def is_entangled(pAB, pB):
     return (H_AB - H_B) < 0
 
 
+def is_cond_entropy_negative(m, A, B):
+    """
+    Returns true if S(A|B) = S(A,B) - S(B) < 0 for QuantumState m i.e. state
+    is entangled in A : B (see is_entangled)
+    S(A,B) >= S_2(A,B) and S(B) <= log|B|, so if S_2(A,B) >= log|B| then
+    S(A|B) >= 0. S_2 needs no eigensolve, so this check is done first
+    """
+    if(m.renyi_2_entropy(A + B) >= np.log2(m.size(B))):
+        return False
+    return m.conditional_entropy(A, B) < 0
+
+
 def is_bell_state_max_entangled(n):
     """
     Returns true if bell states are maximally entangled
     0 < n <= 4 represents bell states; go to function bell_states in entropy.py
     """
-    p = bell_states(n)
-    V = vonNeumann(p)
+    m = quantum_state(bell_states(n), 2)
+    V = m.entropy('AB')
     if(not np.isclose(V,0)): # Bell states are pure states
         return False
 
-    s,_,_,_ = separate(p,2)
-
     # In bell state, separated pA = pB
-    if(not is_entangled(p, s[0])):
+    if(not m.conditional_entropy('B', 'A') < 0):
         return False
 
     # Maximally entangled if H = log d
-    H = vonNeumann(s[0])
-    if(H == np.log2(s[0].shape[0])):
+    H = m.entropy('A')
+    if(H == np.log2(m.size('A'))):
         return True
     return False
 
@@ -103,10 +112,9 @@ def mixed_entangled_bipartite(gen_func, lim, dim):
 
     ent = 0
     for i in range(lim):
-        p = gen_func(dim**2)
-        s,_,_,_ = separate(p, dim)
+        m = quantum_state(gen_func(dim**2), dim)
 
-        if(is_entangled(p, s[1])): #p and pB
+        if(is_cond_entropy_negative(m, 'A', 'B')): #p and pB
             ent = ent + 1
 
     return lim, ent, lim-ent
@@ -146,13 +154,11 @@ def is_entangled_ABC(pABC, dim, cut):
     cut 1 - pA|BC : H(ABC) - H(A) < 0
     cut 2 - pAB|C : H(ABC) - H(AB) < 0
     """
-    s, j, _,_ = separate(pABC, dim)
+    m = quantum_state(pABC, dim)
     if(cut == 1):
-        pA = s[0]
-        return is_entangled(pABC, pA)
+        return is_cond_entropy_negative(m, 'BC', 'A')
     elif(cut == 2):
-        pAB = j[0]
-        return is_entangled(pABC, pAB)
+        return is_cond_entropy_negative(m, 'C', 'AB')
     else:
         print("Error in function 'is_entangled_ABC'")
         print("Cut given is not valid.")
@@ -165,13 +171,11 @@ def is_entangled_ABCD(pABCD, dim, cut):
     cut 1 - pA|BCD : H(ABCD) - H(A) < 0
     cut 2 - pAB|CD : H(ABCD) - H(AB) < 0
     """
-    s, j, j3,_ = separate(pABCD, dim)
+    m = quantum_state(pABCD, dim)
     if(cut == 1):
-        pA = s[0]
-        return is_entangled(pABCD, pA)
+        return is_cond_entropy_negative(m, 'BCD', 'A')
     elif(cut == 2):
-        pAB = j[0]
-        return is_entangled(pABCD, pAB)
+        return is_cond_entropy_negative(m, 'CD', 'AB')
     else:
         print("Error in function 'is_entangled_ABC'")
         print("Cut given is not valid.")
@@ -184,13 +188,11 @@ def is_entangled_5(pABCDE, dim, cut):
     cut 1 - pAB|CDE : H(ABCDE) - H(AB) < 0
     cut 2 - pABC|DE : H(ABCDE) - H(ABC) < 0
     """
-    s, j, j3,j4 = separate(pABCDE, dim)
+    m = quantum_state(pABCDE, dim)
     if(cut == 1):
-        pA = j[0]
-        return is_entangled(pABCDE, pA)
+        return is_cond_entropy_negative(m, 'CDE', 'AB')
     elif(cut == 2):
-        pAB = j3[0]
-        return is_entangled(pABCDE, pAB)
+        return is_cond_entropy_negative(m, 'DE', 'ABC')
 
     else:
         print("Error in function 'is_entangled_ABC' in entropy.py")
@@ -5,29 +5,538 @@ import sys
 
 from numpy import linalg as LA
 from shannon import randomProbabilityDist
-from partial_trace import separate
+from partial_trace import separate, separate_all, Marginals, vector_spectrum
+from partial_trace import LowRankState, is_low_rank, is_state_vector, factor_spectrum
 from utils import *
 from generate_random_quantum import *
 
 
-def vonNeumann(A):
+def vonNeumann(A, tol=None):
     """
     Calculate the Von Neumann Entropy of a quantum state
+    A can also be a state vector |u>, which is pure so has entropy 0, or a
+    LowRankState, whose entropy comes from its eigenvalues
+    A can be a stack of density matrices of shape (batch, n, n), in which case
+    an array of shape (batch,) of their entropies is returned
+    If tol is given, the entropy of A of size >= slq_min_size is estimated
+    without an eigensolve (see slq_entropy for how close the estimate is).
+    As the estimate keeps every eigenvalue, so does the entropy of smaller A
+    when tol is given: only eigenvalues at most rounding_tolerance are left
+    out, instead of those at most 0.0001
+    A can also be a QuantumState, whose cached entropy (computed with the tol
+    of the QuantumState) is returned
     """
 
+    if(isinstance(A, QuantumState)):
+        return A.entropy(mask_labels(A.full))
+
+    if(np.ndim(A) == 1):
+        return 0.0
+
     # Check matrix is square
     check_square_matrix(A, "vonNeumann in entropy.py")
 
-    # Get eigenvalues of A
-    values, _ = LA.eig(A)
-    values = values.real
+    if(tol is not None and np.ndim(A) == 2 and A.shape[-1] >= slq_min_size):
+        return slq_entropy(A, tol)
+
+    if(tol is not None):
+        return spectrum_entropy(np.clip(spectrum(A), 0, None), rounding_tolerance)
+    return spectrum_entropy(spectrum(A))
+
+
+# Smallest density matrix for which vonNeumann(A, tol) (and QuantumState with
+# tol) estimates the entropy by slq_entropy. Smaller matrices are
+# diagonalised, which is faster
+slq_min_size = 2**11
+
+# Largest number of random vectors run through lanczos_quadrature together,
+# so memory is O(slq_chunk * steps * n)
+slq_chunk = 32
+
+def slq_entropy(A, tol=0.05, steps=15, min_probes=20, max_probes=2000):
+    """
+    Estimates the Von Neumann Entropy of density matrix A by stochastic
+    Lanczos quadrature, using only products of A with vectors.
+    S(A) = tr(f(A)) with f(x) = -x log2 x is estimated as the mean of
+    n <v|f(A)|v> / <v|v> over random vectors |v> (Hutchinson's trace
+    estimator), each term computed from steps Lanczos iterations from |v>
+    (Gauss quadrature). Random vectors are added until the 95% confidence
+    interval of the mean is within +- tol, or max_probes are used
+    So the estimate is within tol of its mean in about 95% of calls, not
+    always, and not if max_probes is reached (likely for low rank A, whose
+    terms vary most). The mean is off S(A) by the quadrature error of steps
+    iterations, which for steps = 15 was below 1e-3 on random states of
+    size 2048 and is 0 once steps > rank of A
+    Unlike spectrum_entropy by default, small eigenvalues are not dropped,
+    which matters for large A where every eigenvalue is about 1/n. vonNeumann
+    and QuantumState with tol keep them for systems they diagonalise too
+    """
+    n = A.shape[-1]
+    steps = min(steps, n)
+
+    estimates = []
+    probes = min_probes
+    while(True):
+        for start in range(0, probes, slq_chunk):
+            chunk = min(slq_chunk, probes - start)
+            estimates.extend(lanczos_quadrature(A, chunk, steps))
+        m = len(estimates)
+        error = 1.96 * np.std(estimates, ddof=1) / np.sqrt(m)
+        if(error <= tol or m >= max_probes):
+            break
+        # Enough more vectors to bring the error within tol
+        needed = int(m * (error / tol)**2) - m + 1
+        probes = min(max(needed, min_probes), max_probes - m)
+
+    return np.mean(estimates)
+
+
+def lanczos_quadrature(A, probes, steps):
+    """
+    Returns n <v|f(A)|v> / <v|v> with f(x) = -x log2 x for each of probes
+    random +-1 vectors |v>, from steps Lanczos iterations on all of the
+    vectors at once (see slq_entropy)
+    A only needs A.dot(V) for a (n x probes) matrix V
+    """
+    n = A.shape[-1]
+    V = np.random.choice([-1.0, 1.0], size=(probes, n)) / np.sqrt(n)
+
+    # Lanczos basis Q[:, j] of each vector and its tridiagonal matrix T, with
+    # full reorthogonalisation against the basis
+    Q = np.zeros((probes, steps, n), dtype=np.complex128)
+    alpha = np.zeros((probes, steps))
+    beta = np.zeros((probes, steps))
+    Q[:, 0] = V
+    k = steps
+    for j in range(steps):
+        W = np.asarray(A.dot(Q[:, j].T)).T
+        alpha[:, j] = np.sum(np.conj(Q[:, j]) * W, axis=-1).real
+        basis = Q[:, :j+1]
+        coefficients = np.matmul(np.conj(basis), W[..., None])
+        W -= np.matmul(np.swapaxes(basis, -1, -2), coefficients)[..., 0]
+        b = np.sqrt(np.sum(np.abs(W)**2, axis=-1))
+        if(j + 1 == steps):
+            break
+        # Stop when the Krylov space of every vector is complete
+        if(np.all(b < 1e-12)):
+            k = j + 1
+            break
+        beta[:, j] = b
+        Q[:, j+1] = W / np.where(b < 1e-12, 1, b)[:, None]
+
+    T = np.zeros((probes, k, k))
+    i = np.arange(k)
+    T[:, i, i] = alpha[:, :k]
+    T[:, i[:-1], i[:-1] + 1] = beta[:, :k-1]
+    T[:, i[:-1] + 1, i[:-1]] = beta[:, :k-1]
+
+    # Gauss quadrature: nodes are the eigenvalues of T, weights the squared
+    # first components of its eigenvectors
+    theta, U = LA.eigh(T)
+    theta = np.clip(theta, 0, None)
+    f = -theta * np.log2(np.where(theta > 0, theta, 1))
+    return n * np.sum(U[:, 0, :]**2 * f, axis=-1)
+
+
+def spectrum(A):
+    """
+    Returns the eigenvalues of Hermitian matrix A, or of each matrix in a
+    stack A of shape (batch, n, n)
+    For a LowRankState these are its non-zero eigenvalues (and some zeros),
+    and for a QuantumState its cached eigenvalues
+    """
+    if(isinstance(A, QuantumState)):
+        return A.spectrum(mask_labels(A.full))
+    if(is_low_rank(A)):
+        return A.spectrum()
+    return LA.eigvalsh(np.asarray(A))
+
+
+def spectrum_entropy(values, tolerance=0.0001):
+    """
+    Calculates -sum(v log2 v) over the eigenvalues v in the last axis of
+    values. Eigenvalues close to zero, at most tolerance (including small
+    negative rounding errors), are left out of the sum
+    """
+    values = np.asarray(values)
+    nonzero = np.abs(values) > tolerance
+    logs = np.log2(np.where(nonzero, values, 1))
+    return -np.sum(np.where(nonzero, values * logs, 0), axis=-1)
+
+
+def purity(A):
+    """
+    Returns purity tr(A^2) of density matrix A (or of each matrix in a stack),
+    which is the sum of |A_ij|^2 as A is Hermitian, so needs no eigenvalues
+    For a LowRankState F F* this is the sum of |(F* F)_ij|^2, and for a
+    QuantumState its cached purity
+    """
+    if(isinstance(A, QuantumState)):
+        return A.purity(mask_labels(A.full))
+    if(is_low_rank(A)):
+        A = np.matmul(np.conj(A.factor).T, A.factor)
+    A = np.asarray(A)
+    return np.sum(np.abs(A)**2, axis=(-2, -1))
+
+
+def renyi_2_entropy(A):
+    """
+    Calculate the Renyi entropy of order 2 (collision entropy) of a quantum
+    state: S_2(A) = -log2(tr(A^2)), from the purity of A
+    S_2(A) <= vonNeumann(A) as Renyi entropies are non-increasing in alpha
+    """
+    return -np.log2(purity(A))
+
+
+def is_pure(A):
+    """
+    Returns true if A is a pure state i.e. tr(A^2) = 1, which holds if and
+    only if the von Neumann entropy of A is 0. State vectors are pure
+    """
+    if(np.ndim(A) == 1):
+        return True
+    return np.isclose(purity(A), 1)
+
+
+def pure_entropy(u, dim, labels):
+    """
+    Calculate the Von Neumann Entropy of system labels (e.g. 'AB') of pure
+    state |u>, without computing |u><u| or the density matrix of labels
+    dim = 2 if qubit, dim = 3 if qutrit, or tuple of dimension of each subsystem
+    """
+    func_str = "pure_entropy in entropy.py"
+    dims = local_dims(np.shape(u)[-1], dim, func_str)
+    keep = subsystem_positions(labels)
+    traced = [i for i in range(len(dims)) if i not in keep]
+
+    return spectrum_entropy(vector_spectrum(u, dims, traced))
+
+
+class QuantumState(Marginals):
+    """
+    Quantum state p with its separated systems (see Marginals) and their
+    entropies computed on demand. Each separated system and its entropy is
+    computed once, so functions given the same QuantumState share them e.g.
+        state = QuantumState(pABCD, 2)
+        non_shannon_1(state, 2)
+        non_shannon_2(state, 2)
+    diagonalises each separated system of pABCD at most once.
+    All functions in entropy.py, entangle.py and non_shannon_quantum.py that
+    take a density matrix also take a QuantumState. Those without dim (e.g.
+    vonNeumann, renyi_entropy, purity) use the cached spectrum or purity of
+    the whole state
+    If tol is given, the entropies of systems of size >= slq_min_size are
+    estimated by slq_entropy instead of diagonalising them. Like the
+    estimates, the entropies of all other systems then keep every eigenvalue
+    above rounding_tolerance (not only those above 0.0001), so entropies of
+    estimated and diagonalised systems can be combined
+    """
+
+    def __init__(self, p, dim, pure=None, tol=None):
+        Marginals.__init__(self, p, dim, pure)
+        self.tol = tol
+        # Eigenvalues at most entropy_tolerance are left out of entropies
+        # (see tol)
+        self.entropy_tolerance = 0.0001 if tol is None else rounding_tolerance
+        # Entropies computed by entropy, stored by bitmask
+        self.entropies = {0: 0.0}
+        # Eigenvalues and eigendecompositions computed by spectrum and
+        # decomposition, stored by bitmask
+        self.spectra = {}
+        self.decompositions = {}
+        # Purities computed by purity, stored by bitmask
+        self.purities = {}
+
+    def spectrum(self, labels):
+        """
+        Returns the eigenvalues of the density matrix of system labels
+        """
+        mask = system_mask(labels)
+        if(mask in self.decompositions):
+            return self.decompositions[mask][0]
+        if(mask not in self.spectra):
+            traced = [i for i in range(self.q) if not (mask >> i) & 1]
+            if(self.pure):
+                # Schmidt coefficients of |u>, without forming the system
+                self.spectra[mask] = vector_spectrum(self.p, self.dims, traced)
+            elif(self.low_rank):
+                if(traced):
+                    self.spectra[mask] = factor_spectrum(self.p.factor, self.dims, traced)
+                else:
+                    self.spectra[mask] = self.p.spectrum()
+            else:
+                self.spectra[mask] = spectrum(self.get_mask(mask))
+        return self.spectra[mask]
+
+    def decomposition(self, labels):
+        """
+        Returns (eigenvalues, eigenvectors) of the density matrix of system
+        labels, as returned by LA.eigh
+        Its eigenvalues replace those computed by spectrum, so a system is
+        only diagonalised once if its decomposition is asked for first
+        """
+        mask = system_mask(labels)
+        if(mask not in self.decompositions):
+            self.decompositions[mask] = LA.eigh(np.asarray(self.get_mask(mask)))
+            self.spectra.pop(mask, None)
+        return self.decompositions[mask]
+
+    def purity(self, labels):
+        """
+        Returns purity tr(p^2) of system labels, without an eigensolve
+        """
+        mask = system_mask(labels)
+        if(mask not in self.purities):
+            if(self.pure):
+                # Sum of squared Schmidt coefficients, without forming the system
+                self.purities[mask] = np.sum(self.spectrum(labels)**2, axis=-1)
+            else:
+                self.purities[mask] = purity(self.get_mask(mask))
+        return self.purities[mask]
+
+    def renyi_2_entropy(self, labels):
+        """
+        Returns Renyi entropy of order 2 of system labels (see renyi_2_entropy)
+        """
+        return -np.log2(self.purity(labels))
+
+    def renyi_entropy(self, labels, alpha):
+        """
+        Returns Renyi entropy of order alpha of system labels (see
+        renyi_entropy), from the cached eigenvalues of the system
+        """
+        if(not system_mask(labels)):
+            return spectrum_renyi(np.ones(1), alpha)
+        return spectrum_renyi(self.spectrum(labels), alpha)
+
+    def tsallis_entropy(self, labels, alpha):
+        """
+        Returns Tsallis entropy of order alpha of system labels (see
+        tsallis_entropy), from the cached eigenvalues of the system
+        """
+        if(not system_mask(labels)):
+            return spectrum_tsallis(np.ones(1), alpha)
+        return spectrum_tsallis(self.spectrum(labels), alpha)
+
+    def compute_spectra(self):
+        """
+        Computes the eigenvalues of all systems not computed yet, separating
+        all systems at once and diagonalising systems of the same size together
+        """
+        masks = range(1, self.full + 1)
+
+        # Separate all systems at once if none have been separated yet
+        if(not self.pure and len(self.systems) == 1):
+            levels = separate_all(self.p, self.dim)
+            for labels, level in zip(separate_order(self.q), levels):
+                for l, sub_p in zip(labels, level):
+                    self.systems[system_mask(l)] = sub_p
+
+        missing = [mask for mask in masks
+                   if mask not in self.spectra and mask not in self.decompositions
+                   and not self.estimated(mask)]
+        # Spectra of a state vector or low rank state come from the vector or
+        # factor, without forming the density matrix of any system (see
+        # spectrum)
+        if(self.pure or self.low_rank):
+            for mask in missing:
+                self.spectrum(mask_positions(mask))
+            return
+
+        sizes = {}
+        for mask in missing:
+            sizes.setdefault(self.mask_size(mask), []).append(mask)
+        for size in sizes:
+            same_size = sizes[size]
+            stack = np.stack([np.asarray(self.get_mask(mask)) for mask in same_size], axis=-3)
+            values = spectrum(stack)
+            for i, mask in enumerate(same_size):
+                self.spectra[mask] = values[..., i, :]
+
+    def relative_entropy(self, r, labels):
+        """
+        Returns S(p||r) of system labels of this state p and QuantumState r
+        e.g. state.relative_entropy(r, 'A') = S(pA||rA)
+        """
+        r_values, r_vectors = r.decomposition(labels)
+        return spectra_relative_entropy(self.get(labels), self.spectrum(labels),
+                                        r_values, r_vectors)
+
+    def entropy(self, labels):
+        """
+        Returns von Neumann entropy S(labels) e.g. state.entropy('AB')
+        The entropy of no systems (labels = '') is 0
+        """
+        mask = system_mask(labels)
+        if(mask not in self.entropies):
+            if(self.estimated(mask)):
+                self.entropies[mask] = slq_entropy(self.get_mask(mask), self.tol)
+            else:
+                values = np.clip(self.spectrum(labels), 0, None)
+                self.entropies[mask] = spectrum_entropy(values, self.entropy_tolerance)
+        return self.entropies[mask]
+
+    def estimated(self, mask):
+        """
+        Returns true if entropy estimates the entropy of the system with the
+        given bitmask by slq_entropy (see tol). State vectors and low rank
+        states are not estimated, as their spectra come from small matrices
+        """
+        if(self.tol is None or self.pure or self.low_rank or np.ndim(self.p) != 2):
+            return False
+        if(mask in self.spectra or mask in self.decompositions):
+            return False
+        return self.mask_size(mask) >= slq_min_size
+
+    def conditional_entropy(self, A, B):
+        """
+        Returns S(A|B) = S(A,B) - S(B) e.g. state.conditional_entropy('A', 'BC')
+        """
+        return self.entropy(A + B) - self.entropy(B)
+
+    def mutual_information(self, A, B, C=''):
+        """
+        Returns I(A:B|C) = S(A,C) + S(B,C) - S(C) - S(A,B,C), which is I(A:B)
+        if C is not given e.g. state.mutual_information('C', 'D', 'A')
+        """
+        S_AC = self.entropy(A + C)
+        S_BC = self.entropy(B + C)
+        S_C = self.entropy(C)
+        S_ABC = self.entropy(A + B + C)
+        return S_AC + S_BC - S_C - S_ABC
+
+
+def quantum_state(p, dim, tol=None):
+    """
+    Returns p if it is already a QuantumState, otherwise the QuantumState of
+    density matrix (or state vector) p, with tol (see QuantumState)
+    """
+    if(isinstance(p, QuantumState)):
+        return p
+    return QuantumState(p, dim, tol=tol)
+
+
+def entropy_vector(p, dim, tol=None):
+    """
+    Returns the von Neumann entropies of all 2^q - 1 systems of q-partite
+    state p (density matrix, state vector or QuantumState) in bitmask order
+    i.e. [S(A), S(B), S(A,B), S(C), S(A,C), ...] (see vector_labels)
+    If p is a stack of density matrices, returns array of shape
+    (batch, 2^q - 1) with the entropy vector of each state
+    If tol is given, entropies of systems of size >= slq_min_size are
+    estimated by slq_entropy (see QuantumState)
+    """
+    state = quantum_state(p, dim, tol)
+    masks = range(1, state.full + 1)
+
+    state.compute_spectra()
+
+    return np.stack([state.entropy(mask_labels(mask)) for mask in masks], axis=-1)
+
+
+def renyi_entropy_vector(p, dim, alpha):
+    """
+    Returns the Renyi entropies of order alpha of all 2^q - 1 systems of
+    q-partite state p in bitmask order (see entropy_vector)
+    alpha can be a list of orders, in which case the last axis of the result
+    is over alpha i.e. shape (2^q - 1, len(alpha)), or (batch, 2^q - 1,
+    len(alpha)) for a stack of states
+    """
+    state = quantum_state(p, dim)
+    masks = range(1, state.full + 1)
+
+    state.compute_spectra()
+
+    renyi = [state.renyi_entropy(mask_labels(mask), alpha) for mask in masks]
+    return np.stack(renyi, axis=-1 if np.ndim(alpha) == 0 else -2)
+
+
+def renyi_entropy(A, alpha):
+    """
+    Calculate the Renyi entropy of order alpha >= 0 of a quantum state
+    S_alpha(A) = log2(tr(A^alpha)) / (1 - alpha)
+    alpha = 1 gives the von Neumann entropy and alpha = np.inf the min-entropy
+    Only eigenvalues at most rounding_tolerance are taken as 0, so alpha = 1
+    differs from vonNeumann(A) if A has eigenvalues below 0.0001
+    A can be a stack of density matrices and alpha a list of orders, in which
+    case the last axis of the result is over alpha, or a QuantumState
+    """
+    if(not isinstance(A, QuantumState)):
+        check_square_matrix(A, "renyi_entropy in entropy.py")
+    return spectrum_renyi(spectrum(A), alpha)
+
+
+def tsallis_entropy(A, alpha):
+    """
+    Calculate the Tsallis entropy of order alpha >= 0 of a quantum state
+    T_alpha(A) = (1 - tr(A^alpha)) / (alpha - 1)
+    alpha = 1 gives the von Neumann entropy in nats i.e. ln(2) vonNeumann(A)
+    (see renyi_entropy for the eigenvalues taken as 0)
+    A can be a stack of density matrices and alpha a list of orders, in which
+    case the last axis of the result is over alpha, or a QuantumState
+    """
+    if(not isinstance(A, QuantumState)):
+        check_square_matrix(A, "tsallis_entropy in entropy.py")
+    return spectrum_tsallis(spectrum(A), alpha)
+
+
+# Eigenvalues at most rounding_tolerance (or negative) are taken as 0 in Renyi
+# and Tsallis entropies. Unlike the 0.0001 left out of von Neumann entropies,
+# this only removes rounding errors: for alpha < 1, small eigenvalues
+# dominate tr(p^alpha), and alpha = 0 counts every non-zero eigenvalue
+rounding_tolerance = 1e-12
+
+def spectrum_powers(values, alpha):
+    """
+    Returns sum(v^alpha) over the eigenvalues v in the last axis of values,
+    for each order in alpha (in the last axis of the result if alpha is a
+    list). Eigenvalues at most rounding_tolerance are left out
+    """
+    values = np.asarray(values)
+    alpha = np.asarray(alpha, dtype=float)
+    nonzero = values > rounding_tolerance
+    safe = np.where(nonzero, values, 1)
+    if(alpha.ndim):
+        nonzero = nonzero[..., None, :]
+        safe = safe[..., None, :]
+    powers = np.where(nonzero, safe ** alpha[..., None], 0)
+    return np.sum(powers, axis=-1)
+
+
+def spectrum_renyi(values, alpha):
+    """
+    Calculates the Renyi entropy of order alpha from eigenvalues values (see
+    renyi_entropy)
+    """
+    alpha = np.asarray(alpha, dtype=float)
+    values = np.clip(values, 0, None)
+    S = spectrum_entropy(values, rounding_tolerance)
+    S_min = -np.log2(np.max(values, axis=-1))
+    if(alpha.ndim):
+        S = S[..., None]
+        S_min = S_min[..., None]
 
-    # Take the logarithm of the eigenvalues and sum them
-    x = 0
-    for v in values:
-        if not is_close_to_zero(v):
-            x += v*np.log2(v)
-    return -np.sum(x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        renyi = np.log2(spectrum_powers(values, alpha)) / (1 - alpha)
+    renyi = np.where(alpha == 1, S, renyi)
+    return np.where(np.isinf(alpha), S_min, renyi)[()]
+
+
+def spectrum_tsallis(values, alpha):
+    """
+    Calculates the Tsallis entropy of order alpha from eigenvalues values
+    (see tsallis_entropy)
+    """
+    alpha = np.asarray(alpha, dtype=float)
+    values = np.clip(values, 0, None)
+    S = spectrum_entropy(values, rounding_tolerance) * np.log(2)
+    if(alpha.ndim):
+        S = S[..., None]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tsallis = (1 - spectrum_powers(values, alpha)) / (alpha - 1)
+    tsallis = np.where(alpha == 1, S, tsallis)
+    return np.where(np.isinf(alpha), 0, tsallis)[()]
 
 
 def is_non_neg_VN(A):
@@ -43,7 +552,10 @@ def is_vn_leq_log(A):
     """
     Returns true if in a d-dim Hibert space the entropy is at most log(d)
     """
-    dim = A.shape[0]
+    if(isinstance(A, QuantumState)):
+        dim = A.size(mask_labels(A.full))
+    else:
+        dim = A.shape[0]
     S = vonNeumann(A)
     l = np.log2(dim)
 
@@ -55,10 +567,10 @@ def H_X_leq_H_XY(p):
     Returns true if shannon inequality H(X) <= H(XY) holds
     Note: This should fail to hold for von Neumann entropy if state entangled
     """
-    sys, _, _, _ = separate(p, 2)
-    pA = sys[0]
-    S_A = vonNeumann(pA)
-    S_AB = vonNeumann(p)
+    m = quantum_state(p, 2)
+    S_A = m.entropy('A')
+    # Entropy of the whole state, which is S(AB) only for 2 qubits
+    S_AB = m.entropy(mask_labels(m.full))
 
     return S_A <= S_AB
 
@@ -75,14 +587,13 @@ def conditional_entropy(pAB,dim):
     """
     calculates the conditional entropy: S(A|B) = S(A,B) - S(B)
     """
+    m = quantum_state(pAB, dim)
 
     # Ensure that system is a 2 qubit/qutrit quantum system
-    check_n_q(pAB,dim, 2, "conditional_entropy in entropy.py")
+    check_n_q(m.p, dim, 2, "conditional_entropy in entropy.py")
 
-    s, _,_, _ = separate(pAB,dim)
-    pB = s[1]
-    S_B = vonNeumann(pB)
-    S_AB = vonNeumann(pAB)
+    S_B = m.entropy('B')
+    S_AB = m.entropy('AB')
 
     return S_AB - S_B
 
@@ -91,25 +602,72 @@ def relative_entropy(p,r):
     """
     Calculates the relative entropy of quantum state p to quantum state r
     S(p||r) = tr(p log p) - tr(p log r)
+    tr(p log r) is computed in the eigenbasis of r, so p and r need not
+    commute. If the support of p is not within the support of r, S(p||r) is
+    infinite and np.inf is returned
+    p and r can be stacks of density matrices of shape (batch, n, n), state
+    vectors |u> or QuantumStates (whose eigendecompositions are reused)
     """
 
+    p_state = p if isinstance(p, QuantumState) else None
+    r_state = r if isinstance(r, QuantumState) else None
+    p_mat = density_matrix(p_state.p if p_state else p)
+    r_mat = density_matrix(r_state.p if r_state else r)
+
     # Checks that p and r have same size and are both square
-    check_same_size(p,r,"relative_entropy in entropy.py")
+    check_same_size(p_mat,r_mat,"relative_entropy in entropy.py")
+
+    # r is decomposed first, so if p is r its eigenvalues are reused
+    if(r_state):
+        r_values, r_vectors = r_state.decomposition(mask_labels(r_state.full))
+    else:
+        r_values, r_vectors = LA.eigh(r_mat)
+    if(p_state):
+        p_values = p_state.spectrum(mask_labels(p_state.full))
+    else:
+        p_values = spectrum(p_mat)
+
+    return spectra_relative_entropy(p_mat, p_values, r_values, r_vectors)
 
+
+def density_matrix(p):
+    """
+    Returns p as a dense density matrix: |u><u| for a state vector |u>, the
+    matrix of a LowRankState, or p itself
+    """
+    if(is_low_rank(p)):
+        return p.matrix()
+    if(is_state_vector(p)):
+        return np.outer(p, np.conj(p))
+    return np.asarray(p)
+
+
+# Eigenvalues of r at most support_tolerance are outside the support of r in
+# relative_entropy. This is much smaller than the 0.0001 used for entropies,
+# as log(r) of small but non-zero eigenvalues of r can dominate S(p||r)
+support_tolerance = 1e-10
+
+def spectra_relative_entropy(p, p_values, r_values, r_vectors):
+    """
+    Calculates S(p||r) from the eigenvalues of p and the eigenvalues and
+    eigenvectors of r (see relative_entropy)
+    """
     #  tr(p log p)
-    A = -vonNeumann(p)
+    p_support = p_values > support_tolerance
+    A = np.sum(np.where(p_support, p_values * np.log2(np.where(p_support, p_values, 1)), 0), axis=-1)
 
-    # tr(p log r)
-    eign_p,_ = LA.eig(p)
-    eign_p = eign_p.real
-    eign_r,_ = LA.eig(r)
-    eign_r = eign_r.real
-    l = np.log2(eign_r)
-    B = eign_p*l
-    B = np.sum(B)
+    # tr(p log r) = sum_j <r_j|p|r_j> log(r_j) over eigenvectors |r_j> of r
+    V = np.asarray(r_vectors)
+    weights = np.einsum('...ij,...ik,...kj->...j', np.conj(V), np.asarray(p), V).real
+    support = r_values > support_tolerance
+    logs = np.log2(np.where(support, r_values, 1))
+    B = np.sum(np.where(support, weights * logs, 0), axis=-1)
+
+    # Weight of p outside the support of r
+    outside = np.any(~support & (weights > support_tolerance), axis=-1)
 
     # S(p||r)
-    return A - B
+    return np.where(outside, np.inf, A - B)[()]
 
 
 def monotocity_relative_entropy(pAB, rAB, dim):
@@ -117,17 +675,14 @@ def monotocity_relative_entropy(pAB, rAB, dim):
     Returns true if relative entropy is monotonic i.e. S(pA || rA) <= S(pAB || rAB)
     """
 
-    # Checks that pAB and rAB have same size and are both square
-    check_same_size(pAB,rAB,"monotocity_relative_entropy in entropy.py")
-
-    S_AB = relative_entropy(pAB,rAB)
-    s_p,_,_,_ = separate(pAB,dim)
-    s_r,_,_,_= separate(rAB,dim)
+    p = quantum_state(pAB, dim)
+    r = quantum_state(rAB, dim)
 
-    pA = s_p[0]
-    rA = s_r[0]
+    # Checks that pAB and rAB have same size and are both square
+    check_same_size(p.p,r.p,"monotocity_relative_entropy in entropy.py")
 
-    S_A = relative_entropy(pA, rA)
+    S_AB = p.relative_entropy(r, mask_labels(p.full))
+    S_A = p.relative_entropy(r, 'A')
 
     return (S_A < S_AB) or np.isclose(S_A, S_AB)
 
@@ -136,15 +691,14 @@ def mutual_information(pAB,dim):
     """
     calculates the mutual information defined by: I(A:B) = S(A) + S(B) - S(A,B)
     """
+    m = quantum_state(pAB, dim)
+
     # Ensure that system is a 2 qubit/qutrit quantum system
-    check_n_q(pAB, dim, 2, "mutual_information in entropy.py")
+    check_n_q(m.p, dim, 2, "mutual_information in entropy.py")
 
-    systems, _, _,_ = separate(pAB,dim)
-    pA = systems[0]
-    pB = systems[1]
-    S_A = vonNeumann(pA)
-    S_B = vonNeumann(pB)
-    S_AB = vonNeumann(pAB)
+    S_A = m.entropy('A')
+    S_B = m.entropy('B')
+    S_AB = m.entropy('AB')
 
     return S_A + S_B - S_AB
 
@@ -152,11 +706,11 @@ def bound_mutual_information(pAB,dim):
     """
     ensures that mutual information is within bound 0 <= I(A:B) <= 2min(S(A),S(B))
     """
-    I_AB = mutual_information(pAB,dim)
-    s,_,_,_ = separate(pAB,dim)
+    m = quantum_state(pAB, dim)
+    I_AB = mutual_information(m, dim)
     lower = (I_AB >= 0)
-    S_A = vonNeumann(s[0])
-    S_B = vonNeumann(s[1])
+    S_A = m.entropy('A')
+    S_B = m.entropy('B')
     upper = (I_AB <= 2 * np.minimum(S_A, S_B))
     return lower and upper
 
@@ -164,12 +718,12 @@ def bound_mutual_information_log(pAB,dim):
     """
     ensures that mutual information is within bound I(A:B) <= 2log|A| and 2log|B|
     """
-    I_AB = mutual_information(pAB,dim)
-    s,_,_,_ = separate(pAB,dim)
+    m = quantum_state(pAB, dim)
+    I_AB = mutual_information(m, dim)
 
     # d-dim hilbert space
-    a_dim = s[0].shape[0]
-    b_dim = s[1].shape[0]
+    a_dim = m.size('A')
+    b_dim = m.size('B')
 
     upper = (2*np.log2(a_dim)) or (2*np.log2(b_dim))
     return I_AB <= upper
@@ -179,10 +733,12 @@ def cond_mutual_information(pAC, pC, pABC, pBC, dim):
     """
     calculates conditional mutual information
     I(A:B|C) = S(A,C) - S(C) - S(A,B,C) + S(B,C)
+    Each system can be a density matrix or a QuantumState
     """
 
     # Ensure that system is a 3 qubit/qutrit quantum system
-    check_n_q(pABC, dim, 3, "cond_mutual_information in entropy.py")
+    p = pABC.p if isinstance(pABC, QuantumState) else pABC
+    check_n_q(p, dim, 3, "cond_mutual_information in entropy.py")
 
     S_AC = vonNeumann(pAC)
     S_C = vonNeumann(pC)
@@ -197,16 +753,14 @@ def and_mutual_information(pABC,dim):
     calculates I(A:B,C) = S(A) + S(B,C) - S(A,B,C)
     """
 
-    # Ensure that system is a 3 qubit/qutrit quantum system
-    check_n_q(pABC, dim, 3, "and_mutual_information in entropy.py")
+    m = quantum_state(pABC, dim)
 
-    s,j,j3,_ = separate(pABC,dim)
-    pA = s[0]
-    pBC = j[1]
+    # Ensure that system is a 3 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 3, "and_mutual_information in entropy.py")
 
-    S_BC = vonNeumann(pBC)
-    S_A = vonNeumann(pA)
-    S_ABC = vonNeumann(pABC)
+    S_BC = m.entropy('BC')
+    S_A = m.entropy('A')
+    S_ABC = m.entropy('ABC')
 
     return S_A + S_BC - S_ABC
 
@@ -215,16 +769,14 @@ def weak_subadditivity(pAB,dim):
     Checks that weak subadditivity holds: S(A,B) <= S(A) + S(B)
     (2 qubit system)
     """
+    m = quantum_state(pAB, dim)
 
     # Ensure that system is a 2 qubit/qutrit quantum system
-    check_n_q(pAB, dim, 2, "weak_subadditivity in entropy.py")
+    check_n_q(m.p, dim, 2, "weak_subadditivity in entropy.py")
 
-    systems, _, _,_ = separate(pAB,dim)
-    pA = systems[0]
-    pB = systems[1]
-    S_A = vonNeumann(pA)
-    S_B = vonNeumann(pB)
-    S_AB = vonNeumann(pAB)
+    S_A = m.entropy('A')
+    S_B = m.entropy('B')
+    S_AB = m.entropy('AB')
 
     return S_AB <= S_A + S_B
 
@@ -235,18 +787,15 @@ def strong_subadditivity_q(pABC,dim):
     + H(B,C) (3 qubit system)
     """
 
-    # Ensure that system is a 3 qubit/qutrit quantum system
-    check_n_q(pABC, dim, 3, "strong_subadditivity_q in entropy.py")
+    m = quantum_state(pABC, dim)
 
-    systems, joint_systems,_,_ = separate(pABC,dim)
-    pAB = joint_systems[0]
-    pBC = joint_systems[1]
-    pB = systems[1]
+    # Ensure that system is a 3 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 3, "strong_subadditivity_q in entropy.py")
 
-    S_ABC = vonNeumann(pABC)
-    S_AB = vonNeumann(pAB)
-    S_BC = vonNeumann(pBC)
-    S_B = vonNeumann(pB)
+    S_ABC = m.entropy('ABC')
+    S_AB = m.entropy('AB')
+    S_BC = m.entropy('BC')
+    S_B = m.entropy('B')
 
     return S_ABC + S_B <= S_AB + S_BC
 
@@ -254,16 +803,14 @@ def triangle_inequality(pAB,dim):
     """
     Returns true if S(AB) >= |S(A) - S(B)|
     """
+    m = quantum_state(pAB, dim)
 
     # Ensure that system is a 2 qubit/qutrit quantum system
-    check_n_q(pAB, dim, 2, "triangle_inequality in entropy.py")
+    check_n_q(m.p, dim, 2, "triangle_inequality in entropy.py")
 
-    systems, _, _,_ = separate(pAB,dim)
-    pA = systems[0]
-    pB = systems[1]
-    S_A = vonNeumann(pA)
-    S_B = vonNeumann(pB)
-    S_AB = vonNeumann(pAB)
+    S_A = m.entropy('A')
+    S_B = m.entropy('B')
+    S_AB = m.entropy('AB')
 
     abs = np.absolute(S_A - S_B)
 
@@ -274,18 +821,15 @@ def cond_triangle_inequality(pABC, dim):
     Returns true if S(A|BC) >= S(A|C) - S(B|C)
     """
 
-    # Ensure that system is a 3 qubit/qutrit quantum system
-    check_n_q(pABC, dim, 3, "cond_triangle_inequality in entropy.py")
+    m = quantum_state(pABC, dim)
 
-    systems, joint_systems,_,_ = separate(pABC,dim)
-    pBC = joint_systems[1]
-    pAC = joint_systems[1]
-    pC = systems[2]
+    # Ensure that system is a 3 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 3, "cond_triangle_inequality in entropy.py")
 
-    S_ABC = vonNeumann(pABC)
-    S_AC = vonNeumann(pAC)
-    S_BC = vonNeumann(pBC)
-    S_C = vonNeumann(pC)
+    S_ABC = m.entropy('ABC')
+    S_AC = m.entropy('AC')
+    S_BC = m.entropy('BC')
+    S_C = m.entropy('C')
 
     S_AB_C = S_ABC - S_BC
     S_A_C = S_AC - S_C
@@ -298,17 +842,13 @@ def cond_reduce_entropy(pABC, dim):
     Returns true if S(A|BC) <= S(A|B)
     """
 
-    systems, joint_systems,_,_ = separate(pABC,dim)
-    pA = systems[0]
-    pB = systems[1]
-    pAB = joint_systems[0]
-    pBC = joint_systems[1]
+    m = quantum_state(pABC, dim)
 
-    S_A = vonNeumann(pA)
-    S_B = vonNeumann(pB)
-    S_AB = vonNeumann(pAB)
-    S_BC = vonNeumann(pBC)
-    S_ABC = vonNeumann(pABC)
+    S_A = m.entropy('A')
+    S_B = m.entropy('B')
+    S_AB = m.entropy('AB')
+    S_BC = m.entropy('BC')
+    S_ABC = m.entropy('ABC')
 
     S_A_BC = S_ABC - S_BC
     S_A_B = S_AB - S_B
@@ -320,17 +860,13 @@ def mutual_info_not_increase(pABC, dim):
     """
     Returns true if I(A:B) <= I(A:BC)
     """
-    systems, joint_systems,_,_ = separate(pABC,dim)
-    pA = systems[0]
-    pB = systems[1]
-    pAB = joint_systems[0]
-    pBC = joint_systems[1]
+    m = quantum_state(pABC, dim)
 
-    S_A = vonNeumann(pA)
-    S_B = vonNeumann(pB)
-    S_AB = vonNeumann(pAB)
-    S_BC = vonNeumann(pBC)
-    S_ABC = vonNeumann(pABC)
+    S_A = m.entropy('A')
+    S_B = m.entropy('B')
+    S_AB = m.entropy('AB')
+    S_BC = m.entropy('BC')
+    S_ABC = m.entropy('ABC')
 
     S_A_BC = S_A + S_BC - S_ABC
     S_A_B = S_A + S_B - S_AB
@@ -343,19 +879,14 @@ def subadditivity_of_cond_1(pABCD, dim):
     Returns true if S(AB|CD) <= S(A|C) + S(B|D)
     """
 
-    systems, joint_systems,_,_ = separate(pABCD,dim)
-    pC = systems[2]
-    pD = systems[3]
-    pAC = joint_systems[2]
-    pBD = joint_systems[3]
-    pCD = joint_systems[5]
+    m = quantum_state(pABCD, dim)
 
-    S_C = vonNeumann(pC)
-    S_D = vonNeumann(pD)
-    S_AC = vonNeumann(pAC)
-    S_BD = vonNeumann(pBD)
-    S_CD = vonNeumann(pCD)
-    S_ABCD = vonNeumann(pABCD)
+    S_C = m.entropy('C')
+    S_D = m.entropy('D')
+    S_AC = m.entropy('AC')
+    S_BD = m.entropy('BD')
+    S_CD = m.entropy('CD')
+    S_ABCD = m.entropy('ABCD')
 
     S_B_D = S_BD - S_D
     S_A_C = S_AC - S_C
@@ -368,15 +899,12 @@ def subadditivity_of_cond_2(pABC, dim):
     """
     Returns S(AB|C) <= S(A|C) + S(B|C)
     """
-    s,j,_,_ = separate(pABC, dim)
-    pC = s[2]
-    pBC = j[1]
-    pAC = j[2]
+    m = quantum_state(pABC, dim)
 
-    S_C = vonNeumann(pC)
-    S_BC = vonNeumann(pBC)
-    S_AC= vonNeumann(pAC)
-    S_ABC = vonNeumann(pABC)
+    S_C = m.entropy('C')
+    S_BC = m.entropy('BC')
+    S_AC= m.entropy('AC')
+    S_ABC = m.entropy('ABC')
 
     S_B_C = S_BC - S_C
     S_A_C = S_AC - S_C
@@ -389,19 +917,14 @@ def subadditivity_of_cond_3(pABC, dim):
     """
     Returns S(A|BC) <= S(A|B) + S(A|C)
     """
-    s,j,_,_ = separate(pABC, dim)
-    pB = s[1]
-    pC = s[2]
-    pAB = j[0]
-    pBC = j[1]
-    pAC = j[2]
+    m = quantum_state(pABC, dim)
 
-    S_B = vonNeumann(pB)
-    S_C = vonNeumann(pC)
-    S_AB = vonNeumann(pAB)
-    S_BC = vonNeumann(pBC)
-    S_AC = vonNeumann(pAC)
-    S_ABC = vonNeumann(pABC)
+    S_B = m.entropy('B')
+    S_C = m.entropy('C')
+    S_AB = m.entropy('AB')
+    S_BC = m.entropy('BC')
+    S_AC = m.entropy('AC')
+    S_ABC = m.entropy('ABC')
 
     S_A_B = S_AB - S_B
     S_A_C = S_AC - S_C
@@ -415,17 +938,13 @@ def cond_strong_subadditivity(pABCD, dim):
     Returns S(ABC|D) + S(B|D) <= S(AB|D) + S(BC|D)
     """
 
-    systems, joint_systems,j3,_ = separate(pABCD,dim)
-    pD = systems[3]
-    pBD = joint_systems[3]
-    pABD = j3[1]
-    pBCD = j3[2]
+    m = quantum_state(pABCD, dim)
 
-    S_BCD = vonNeumann(pBCD)
-    S_ABD = vonNeumann(pABD)
-    S_BD = vonNeumann(pBD)
-    S_D = vonNeumann(pD)
-    S_ABCD = vonNeumann(pABCD)
+    S_BCD = m.entropy('BCD')
+    S_ABD = m.entropy('ABD')
+    S_BD = m.entropy('BD')
+    S_D = m.entropy('D')
+    S_ABCD = m.entropy('ABCD')
 
     S_BC_D = S_BCD - S_D
     S_AB_D = S_ABD - S_D
@@ -5,7 +5,7 @@ import math
 import random
 import sys
 from numpy import linalg as LA
-from entropy import vonNeumann
+from entropy import vonNeumann, spectrum, spectrum_entropy
 from generate_random_quantum import generate_hermitian
 from utils import *
 
@@ -63,8 +63,21 @@ def depolarising_channel(Q, prob):
     the d-dimensional quantum system is depolarised
     """
 
-    # We will focus on only qubit and qutrit
     dim = Q.shape[0]
+    d = depolarising_dim(dim)
+
+    I = np.eye(dim)
+    E = (prob/d) * I
+
+    return E + (1-prob)*Q
+
+
+def depolarising_dim(dim):
+    """
+    Returns d, the dimension of each subsystem of a dim x dim qubit (d = 2)
+    or qutrit (d = 3) system, used by depolarising_channel
+    """
+    # We will focus on only qubit and qutrit
     d = 2
     if(isPowerof3(dim)):
         d = 3
@@ -72,11 +85,22 @@ def depolarising_channel(Q, prob):
         print("Error in Function 'depolarising_channel in evolution.py':")
         print("Density matrix given is not a qubit or qutrit system.")
         sys.exit()
+    return d
 
-    I = np.eye(dim)
-    E = (prob/d) * I
 
-    return E + (1-prob)*Q
+def depolarising_entropy_sweep(Q, probs):
+    """
+    Returns the entropy of Q and an array of the entropies of
+    depolarising_channel(Q, prob) for each prob in probs, from one eigensolve
+    E(Q) = (prob * I)/d + (1-prob)*Q has the eigenvectors of Q, with
+    eigenvalues (1-prob)*v + prob/d for each eigenvalue v of Q
+    """
+    d = depolarising_dim(Q.shape[0])
+    values = spectrum(Q)
+    probs = np.asarray(probs, dtype=float)[:, None]
+    evolved = (1 - probs) * values + probs / d
+
+    return spectrum_entropy(values), spectrum_entropy(evolved)
 
 
 def bit_flip_channel(Q, prob):
@@ -183,6 +207,30 @@ def CTPT_entropy(op, p, prob):
     return H_p, H_e
 
 
+def CTPT_entropy_sweep(op, p, probs):
+    """
+    Returns H(p) and an array of H(E(p)) for quantum operator op = E with
+    each probability in probs (see CTPT_entropy)
+    The depolarising channel is done from one eigensolve of p (see
+    depolarising_entropy_sweep), other channels evolve p for each prob
+    """
+    if(op is depolarising_channel):
+        return depolarising_entropy_sweep(p, probs)
+
+    H_p = vonNeumann(p)
+    H_e = np.array([vonNeumann(op(p, prob)) for prob in probs])
+    return H_p, H_e
+
+
+def is_CPTP_entropy_more_sweep(op, p, probs):
+    """
+    Returns array of whether H(E(p)) >= H(p) (see is_CPTP_entropy_more) for
+    each probability in probs, with the same isclose as is_CPTP_entropy_more
+    """
+    H_p, H_e = CTPT_entropy_sweep(op, p, probs)
+    return (H_e > H_p) | isclose(H_e, H_p)
+
+
 def is_unital(op, n):
     """
     Checks that quantum channel op is unital i.e op(I) = I, I being the identity
@@ -29,12 +29,56 @@ test_defs_true(generate, is_vn_leq_log, lim)
 test_defs_true(generate_2, is_vn_leq_log, lim)
 test_defs_true(generate_pure_state, is_vn_leq_log, lim)
 
+# Test separating stacks of states
+test_batch_separate(generate, lim)
+test_batch_separate(generate_pure_state, lim)
+
+# Test separating pure states given as state vectors
+test_pure_vector_separate(lim)
+test_pure_vector_separate_memory(12)
+
+# Test separating a large state makes no copy of it
+test_separate_memory(10)
+
+# Test separating states stored on disk
+test_stream_separate(generate, lim)
+test_stream_separate_memory(10)
+
+# Test entropies of stacks of states
+test_batch_vonNeumann(generate, lim)
+
+# Test non-Shannon inequalities sharing separated systems and entropies
+test_quantum_state_shared(generate, lim)
+
+# Test entropy vectors of stacks of states
+test_entropy_vector(generate, lim)
+
+# Test entropy vectors of state vectors never form any system of the state
+test_pure_entropy_vector(3)
+
+# Test Renyi and Tsallis entropies against von Neumann entropy
+test_renyi_limit(generate, lim)
+test_renyi_small_eigenvalues(lim)
+
+# Test stochastic Lanczos estimate of entropy of large full and low rank states
+test_slq_entropy(512, 20)
+test_slq_entropy(20, 20)
+test_slq_quantum_state()
+
+# Test low rank states kept as a factor against their density matrices
+test_low_rank_state(generate_low_rank, lim)
+test_low_rank_state(generate_3_low_rank, lim)
+test_low_rank_state(generate_3_low_rank, lim, 3)
+
 # Test if random pure states have entropy of zero
 test_defs(generate_pure_state, test_pure_state_entropy_is_zero, lim)
 
 #Test if relative entropy is non negative
 test_re(generate, test_relative_entropy_non_negative, lim)
 
+# Test if relative entropy of a mixed state to a pure state is infinite
+test_relative_entropy_support(lim)
+
 # Test if relative entropy is monotonic
 test_monotonic_re(generate, monotocity_relative_entropy, lim)
 
@@ -110,6 +154,13 @@ test_4_partite(generate_3, cond_strong_subadditivity, lim)
 test_4_partite(generate_pure_state, cond_strong_subadditivity, lim)
 
 lim = 100000
+# Test all non shannon entropies hold for extensive amount of quantum states,
+# a stack of states at a time
+test_non_shannon_all(generate, lim)
+test_non_shannon_all(generate_2, lim)
+test_non_shannon_all(generate_3, lim)
+test_non_shannon_all(generate_pure_state, lim)
+
 # Test non shannpn entropies hold for extensive amount of quantum states
 test_non_shannon(generate, non_shannon_1, lim)
 test_non_shannon(generate_2, non_shannon_1, lim)
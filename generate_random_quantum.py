@@ -5,7 +5,7 @@ import random
 
 from numpy import linalg as LA
 from shannon import randomProbabilityDist
-from partial_trace import separate
+from partial_trace import separate, Marginals, LowRankState
 from utils import *
 
 def unitary(n):
@@ -141,6 +141,34 @@ def generate(n):
     return A
 
 
+def generate_low_rank(n):
+    """
+    Generate random nxn density matrix A = UDU* as in generate(n), kept as
+    LowRankState(U, D) so that A is never formed and its eigenvalues are known
+    """
+    assert n != 0
+
+    U = generate_unitary(n)
+    diag = np.asarray(randomProbabilityDist(n), dtype=float)
+
+    return LowRankState(U, diag / np.sum(diag))
+
+
+def generate_rank(n, r):
+    """
+    Generate random nxn density matrix of rank r as LowRankState F F*, where
+    F is a random n x r matrix from the gaussian distribution (see generate_2)
+    """
+    assert n != 0 and r != 0
+
+    F = np.random.randn(n, r) + 1j*np.random.randn(n, r)
+
+    # For trace of 1
+    F = F / np.sqrt(np.sum(np.abs(F)**2))
+
+    return LowRankState(F)
+
+
 def generate_2(n):
     """
     Generate random nxn density matrix A.
@@ -200,9 +228,9 @@ def generate_2(n):
 #     return pA
 
 
-def generate_pure_state(n):
+def generate_pure_vector(n):
     """
-    Generate random pure quantum state
+    Generate random pure quantum state as state vector |u> of length n
     Note: Can generate up any qubit and qutrit state as suggested on
     page 119 of:
     https://www.iitis.pl/~miszczak/files/papers/miszczak12generating.pdf
@@ -215,18 +243,20 @@ def generate_pure_state(n):
 
     # Choose random column number and column
     k = np.random.randint(n)
-    temp = np.zeros(n)
     # |u>     columns: U[0..n, k]
-    u = np.array(temp, dtype=np.complex128)
-    for i in range(U.shape[0]):
-        u[i] = U[i, k]
+    u = np.array(U[:, k], dtype=np.complex128).ravel()
+
+    return u
 
-    # <u|
-    u_mat = np.matrix(u)
-    u_conj = u_mat.getH()
+
+def generate_pure_state(n):
+    """
+    Generate random pure quantum state p = |u><u| (see generate_pure_vector)
+    """
+    u = generate_pure_vector(n)
 
     # p = |u> <u|
-    p = (u_mat.T).dot(u_conj.T)
+    p = np.matrix(np.outer(u, np.conj(u)))
 
     return p
 
@@ -238,13 +268,11 @@ def generate_4part(n, dim):
     assert n != 0
 
     # Generate pure state of dim*n
-    P = generate_pure_state(n*dim)
+    u = generate_pure_vector(n*dim)
 
     # Take partial trace over one system to get mixed state
-    _,_,_,j = separate(P, dim)
-    # Return a random mixed state
-    # k = np.random.randint(len(j))
-    return j[0]
+    m = Marginals(u, dim)
+    return m.get(range(m.q - 1))
 
 def generate_3(n):
     """
@@ -260,14 +288,27 @@ def generate_3(n):
         dim = 3
 
     # Generate pure state of dim*n
-    P = generate_pure_state(n*dim)
+    u = generate_pure_vector(n*dim)
 
     # Take partial trace over one system to get mixed state
-    s,j,j3,j4 = separate(P, dim)
-    if(len(j) == 0):
-        return s[0]
-    if(len(j3) == 0):
-        return j[0]
-    if(len(j4) == 0):
-        return j3[0]
-    return j4[0]
+    m = Marginals(u, dim)
+    return m.get(range(m.q - 1))
+
+
+def generate_3_low_rank(n):
+    """
+    Returns mixed nxn state as in generate_3(n), kept as a LowRankState
+    Tracing the last system out of pure state |u> gives M M*, where M is |u>
+    reshaped to n x dim, so M is a factor of rank at most dim
+    """
+    assert n != 0
+
+    dim = 0
+    if(isPowerof2(n)):
+        dim = 2
+    elif(isPowerof3(n)):
+        dim = 3
+
+    u = generate_pure_vector(n*dim)
+
+    return LowRankState(u.reshape(n, dim))
@@ -20,23 +20,16 @@ plt.show()
 
 # FOR PLOTTING AVERGAGE ENTROPY DIFFERENCE BIT FLIP CHANNEL
 def plot_channel_ent_diff(channel_func, channel_name):
-    diff_e = [[] for i in range(11)]
+    prob_list = np.linspace(0, 1, 11)
+    diff_e = np.zeros(len(prob_list))
     for n in range(1000):
         p = generate(2)
-        prob = 0
+        e, ev = CTPT_entropy_sweep(channel_func, p, prob_list)
+        diff_e = diff_e + (ev - e)
 
-        for i in range(11):
-            e, ev = CTPT_entropy(channel_func,p, prob)
-            diff_e[i].append(ev-e)
-            prob = prob + 0.1
-
-    d = []
     # avg. diff_e
-    for i in range(11):
-        s = sum(diff_e[i]) / 1000
-        d.append(s)
+    d = diff_e / 1000
 
-    prob_list = [0.1*i for i in range(0,11)]
     plt.plot(prob_list, d)
     plt.xlabel('Probability')
     plt.ylabel(channel_name + ' channel entropy difference')
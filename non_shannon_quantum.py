@@ -4,7 +4,6 @@ import random
 
 from numpy import linalg as LA
 from shannon import randomProbabilityDist
-from partial_trace import separate
 from entropy import *
 from utils import *
 
@@ -18,20 +17,17 @@ def non_shannon_1(pABCD,dim):
     2I(C:D) <= I(A:B) + I(A:C,D) + 3I(C:D|A) + I(C:D|B)
     """
 
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq2 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq2 in entropy.py")
 
-    I_C_D = mutual_information(pCD,dim)        # I(C:D)
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_ACD = and_mutual_information(pACD,dim)   # I(A:C,D)
+    I_C_D = m.mutual_information('C', 'D')        # I(C:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_ACD = m.mutual_information('A', 'CD')   # I(A:C,D)
 
-    I_CD_A = cond_mutual_information(pAC, pA, pACD, pAD, dim) # I(C:D|A)
-    I_CD_B = cond_mutual_information(pBC, pB, pBCD, pBD, dim) # I(C:D|B)
+    I_CD_A = m.mutual_information('C', 'D', 'A') # I(C:D|A)
+    I_CD_B = m.mutual_information('C', 'D', 'B') # I(C:D|B)
 
     LHS = 2*I_C_D
     RHS = I_A_B + I_ACD + 3*I_CD_A + I_CD_B
@@ -48,23 +44,19 @@ def non_shannon_1_ghz(pABCD,dim):
     2I(C:D) <= I(A:B) + I(A:C,D) + 3I(C:D|A) + I(C:D|B)
     """
 
+    m = quantum_state(pABCD, dim)
+
     # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq2 in entropy.py")
+    check_n_q(m.p, dim, 4, "new_eq2 in entropy.py")
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[0], j3[0], j3[0]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[0], j[0], j[0], j[0], j[0]
-    pA, pB, pC, pD = s[0], s[0], s[0], s[0]
+    # All separated systems of a GHZ state are equal so only pA, pAB and
+    # pABC are needed
+    H_A = H_B = H_C = H_D = m.entropy('A')
+    H_AB = H_CD = m.entropy('AB')
+    H_ABC = m.entropy('ABC')
 
-    H_C = vonNeumann(pC)
-    H_D = vonNeumann(pD)
-    H_CD = vonNeumann(pCD)
     I_C_D = H_C + H_D - H_CD        # I(C:D)
-    H_A = vonNeumann(pA)
-    H_B = vonNeumann(pB)
-    H_AB = vonNeumann(pAB)
     I_A_B = H_A + H_B - H_AB         # I(A:B)
-    H_ABC = vonNeumann(pABC)
     I_ACD = H_A + H_AB - H_ABC   # I(A:C,D)
 
     I_CD_A = H_AB + H_AB - H_A - H_ABC # I(C:D|A)
@@ -88,21 +80,18 @@ def non_shannon_2(pABCD,dim):
     2I(A:B) <= 3I(A:B|C) + 3I(A:C|B) + 3I(B:C|A) + 2I(A:D) +2I(B:C|D)
     """
 
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq3 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq3 in entropy.py")
 
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_A_D = mutual_information(pAD,dim)        # I(A:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_A_D = m.mutual_information('A', 'D')        # I(A:D)
 
-    I_AB_C = cond_mutual_information(pAC, pC, pABC, pBC, dim) # I(A:B|C)
-    I_AC_B = cond_mutual_information(pAB, pB, pABC, pBC, dim) # I(A:D|B)
-    I_BC_A = cond_mutual_information(pAB, pA, pABC, pAC, dim) # I(B:C|A)
-    I_BC_D = cond_mutual_information(pBD, pD, pBCD, pCD, dim) # I(B:C|D)
+    I_AB_C = m.mutual_information('A', 'B', 'C') # I(A:B|C)
+    I_AC_B = m.mutual_information('A', 'C', 'B') # I(A:C|B)
+    I_BC_A = m.mutual_information('B', 'C', 'A') # I(B:C|A)
+    I_BC_D = m.mutual_information('B', 'C', 'D') # I(B:C|D)
 
     LHS = 2*I_A_B
     RHS = 3*I_AB_C + 3*I_AC_B + 3*I_BC_A + 2*I_A_D + 2*I_BC_D
@@ -120,22 +109,19 @@ def non_shannon_3(pABCD,dim):
     2I(A:B) <= 4I(A:B|C) + I(A:C|B) + 2I(B:C|A) + 3I(A:B|D) + I(B:D|A) + 2I(C:D)
     """
 
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq4 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq4 in entropy.py")
 
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_C_D = mutual_information(pCD,dim)        # I(C:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_C_D = m.mutual_information('C', 'D')        # I(C:D)
 
-    I_AB_C = cond_mutual_information(pAC, pC, pABC, pBC, dim) # I(A:B|C)
-    I_AC_B = cond_mutual_information(pAB, pB, pABC, pBC, dim) # I(A:C|B)
-    I_BC_A = cond_mutual_information(pAB, pA, pABC, pAC, dim) # I(B:C|A)
-    I_AB_D = cond_mutual_information(pAD, pD, pABD, pBD, dim) # I(A:B|D)
-    I_BD_A = cond_mutual_information(pAB, pA, pABD, pAD, dim) # I(B:D|A)
+    I_AB_C = m.mutual_information('A', 'B', 'C') # I(A:B|C)
+    I_AC_B = m.mutual_information('A', 'C', 'B') # I(A:C|B)
+    I_BC_A = m.mutual_information('B', 'C', 'A') # I(B:C|A)
+    I_AB_D = m.mutual_information('A', 'B', 'D') # I(A:B|D)
+    I_BD_A = m.mutual_information('B', 'D', 'A') # I(B:D|A)
 
     LHS = 2*I_A_B
     RHS = 4*I_AB_C + I_AC_B + 2*I_BC_A +3*I_AB_D + I_BD_A + 2*I_C_D
@@ -154,23 +140,20 @@ def non_shannon_4(pABCD,dim):
     2I(B:D) + I(C:D|A)
     """
 
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq5 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq5 in entropy.py")
 
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_B_D = mutual_information(pBD,dim)        # I(B:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_B_D = m.mutual_information('B', 'D')        # I(B:D)
 
-    I_AB_C = cond_mutual_information(pAC, pC, pABC, pBC, dim) # I(A:B|C)
-    I_AC_B = cond_mutual_information(pAB, pB, pABC, pBC, dim) # I(A:C|B)
-    I_BC_A = cond_mutual_information(pAB, pA, pABC, pAC, dim) # I(B:C|A)
-    I_AC_D = cond_mutual_information(pAD, pD, pACD, pCD, dim) #(A:C|D)
-    I_AD_C = cond_mutual_information(pAC, pC, pACD, pCD, dim) #(A:D|C)
-    I_CD_A = cond_mutual_information(pAC, pA, pACD, pAD, dim) #(C:D|A)
+    I_AB_C = m.mutual_information('A', 'B', 'C') # I(A:B|C)
+    I_AC_B = m.mutual_information('A', 'C', 'B') # I(A:C|B)
+    I_BC_A = m.mutual_information('B', 'C', 'A') # I(B:C|A)
+    I_AC_D = m.mutual_information('A', 'C', 'D') #(A:C|D)
+    I_AD_C = m.mutual_information('A', 'D', 'C') #(A:D|C)
+    I_CD_A = m.mutual_information('C', 'D', 'A') #(C:D|A)
 
     LHS = 2*I_A_B
     RHS = 3*I_AB_C + 2*I_AC_B + 4*I_BC_A + 2*I_AC_D + I_AD_C + 2*I_B_D + I_CD_A
@@ -186,21 +169,18 @@ def non_shannon_5(pABCD,dim):
     Returns true if:
     2I(A:B) <= 5I(A:B|C) + 3I(A:C|B) + I(B:C|A) + 2I(A:D) + 2I(B:C|D)
     """
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq6 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq6 in entropy.py")
 
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_A_D = mutual_information(pAD,dim)        # I(A:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_A_D = m.mutual_information('A', 'D')        # I(A:D)
 
-    I_AB_C = cond_mutual_information(pAC, pC, pABC, pBC, dim) # I(A:B|C)
-    I_AC_B = cond_mutual_information(pAB, pB, pABC, pBC, dim) # I(A:C|B)
-    I_BC_A = cond_mutual_information(pAB, pA, pABC, pAC, dim) # I(B:C|A)
-    I_BC_D = cond_mutual_information(pBD, pD, pBCD, pCD, dim) # I(B:C|D)
+    I_AB_C = m.mutual_information('A', 'B', 'C') # I(A:B|C)
+    I_AC_B = m.mutual_information('A', 'C', 'B') # I(A:C|B)
+    I_BC_A = m.mutual_information('B', 'C', 'A') # I(B:C|A)
+    I_BC_D = m.mutual_information('B', 'C', 'D') # I(B:C|D)
 
     LHS = 2*I_A_B
     RHS = 5*I_AB_C + 3*I_AC_B + I_BC_A + 2*I_A_D + 2*I_BC_D
@@ -217,22 +197,19 @@ def non_shannon_6(pABCD,dim):
     2I(A:B) <= 4I(A:B|C) + 4I(A:C|B) + I(B:C|A) + 2I(A:D) + 3I(B:C|D) + I(C:D|B)
     """
 
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq7 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq7 in entropy.py")
 
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_A_D = mutual_information(pAD,dim)        # I(A:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_A_D = m.mutual_information('A', 'D')        # I(A:D)
 
-    I_AB_C = cond_mutual_information(pAC, pC, pABC, pBC, dim) # I(A:B|C)
-    I_AC_B = cond_mutual_information(pAB, pB, pABC, pBC, dim) # I(A:C|B)
-    I_BC_A = cond_mutual_information(pAB, pA, pABC, pAC, dim) # I(B:C|A)
-    I_BC_D = cond_mutual_information(pBD, pD, pBCD, pCD, dim) # I(B:C|D)
-    I_CD_B = cond_mutual_information(pBC, pB, pBCD, pBD, dim) # I(C:D|B)
+    I_AB_C = m.mutual_information('A', 'B', 'C') # I(A:B|C)
+    I_AC_B = m.mutual_information('A', 'C', 'B') # I(A:C|B)
+    I_BC_A = m.mutual_information('B', 'C', 'A') # I(B:C|A)
+    I_BC_D = m.mutual_information('B', 'C', 'D') # I(B:C|D)
+    I_CD_B = m.mutual_information('C', 'D', 'B') # I(C:D|B)
 
     LHS = 2*I_A_B
     RHS = 4*I_AB_C + 4*I_AC_B + I_BC_A + 2*I_A_D + 2*I_BC_D + I_CD_B
@@ -249,23 +226,20 @@ def non_shannon_7(pABCD,dim):
     2I(A:B) <= 3I(A:B|C) + 2I(A:C|B) + 2I(B:C|A) + 2I(A:B|D) + I(A:D|B) + I(B:D|A) + 2I(C:D)
     """
 
-    # Ensure that system is a 4 qubit/qutrit quantum system
-    check_n_q(pABCD, dim, 4, "new_eq8 in entropy.py")
+    m = quantum_state(pABCD, dim)
 
-    s,j,j3,_ = separate(pABCD,dim)
-    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
-    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
-    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "new_eq8 in entropy.py")
 
-    I_A_B = mutual_information(pAB,dim)        # I(A:B)
-    I_C_D = mutual_information(pCD,dim)        # I(C:D)
+    I_A_B = m.mutual_information('A', 'B')        # I(A:B)
+    I_C_D = m.mutual_information('C', 'D')        # I(C:D)
 
-    I_AB_C = cond_mutual_information(pAC, pC, pABC, pBC, dim) # I(A:B|C)
-    I_AC_B = cond_mutual_information(pAB, pB, pABC, pBC, dim) # I(A:C|B)
-    I_BC_A = cond_mutual_information(pAB, pA, pABC, pAC, dim) # I(B:C|A)
-    I_AB_D = cond_mutual_information(pAD, pD, pABD, pBD, dim) # I(A:B|D)
-    I_AD_B = cond_mutual_information(pAB, pB, pABD, pBD, dim) # I(A:D|B)
-    I_BD_A = cond_mutual_information(pAB, pA, pABD, pAD, dim) # I(B:D|A)
+    I_AB_C = m.mutual_information('A', 'B', 'C') # I(A:B|C)
+    I_AC_B = m.mutual_information('A', 'C', 'B') # I(A:C|B)
+    I_BC_A = m.mutual_information('B', 'C', 'A') # I(B:C|A)
+    I_AB_D = m.mutual_information('A', 'B', 'D') # I(A:B|D)
+    I_AD_B = m.mutual_information('A', 'D', 'B') # I(A:D|B)
+    I_BD_A = m.mutual_information('B', 'D', 'A') # I(B:D|A)
 
     LHS = 2*I_A_B
     RHS = 3*I_AB_C + 2*I_AC_B + 2*I_BC_A + 2*I_AB_D + I_AD_B + I_BD_A + 2*I_C_D
@@ -274,3 +248,21 @@ def non_shannon_7(pABCD,dim):
     diff = RHS - LHS
 
     return LHS <= RHS, diff
+
+
+def non_shannon_all(pABCD, dim):
+    """
+    Returns (holds, diff) for all 7 non shannon-type inequalities at once,
+    where diff is RHS - LHS of non_shannon_1 ... non_shannon_7 (see
+    non_shannon_terms in utils.py)
+    pABCD can be a stack of states, in which case holds and diff have shape
+    (batch, 7) and all states are checked with one matrix multiply
+    """
+    m = quantum_state(pABCD, dim)
+
+    # Ensure that system is a 4 qubit/qutrit quantum system
+    check_n_q(m.p, dim, 4, "non_shannon_all in non_shannon_quantum.py")
+
+    diff = inequality_slack(entropy_vector(m, dim), non_shannon_matrix())
+
+    return diff >= 0, diff
@@ -5,8 +5,8 @@ import random
 import sys
 from utils import *
 
-# Class that computes partial trace in 2, 3 and 4 qubits
-# and 2,3 and 4 qutrits systems
+# Class that computes partial trace of systems made of any number of qubits,
+# qutrits or d-dimensional systems
 
 # Separates quantum state p by computing its partial trace
 # Separated systems are saved in list systems iself.e. pA, pB ...
@@ -15,537 +15,563 @@ from utils import *
 # Intermediate bi-partite systems are stored
 # Order for pABC:  pAB, pBC, pAC
 # Order for pABCD: pAB (0), pBC (1), pAC (2), pBD (3), pAD (4), pCD (5)
-# Order for pABCDE: pAB, pAC, pAD, pBC, pBD, pAE, pBE, pCD, pCE
+# Order for pABCDE: pAB, pBC, pAC, pBD, pAD, pCD, pBE, pAE, pCE, pDE
 # joint_systems = []
 
 # Intermediate  tri-partite systems are stored
 # Order for pABCD: pABC (0), pABD (1), pBCD (2), pACD (3)
-# Order for pABCDE: pABC (0), pABD (2), pACD (3) ,pBCD, pABE, pACE, pBCE, pADE,
-#                   pBDE, pCDE (9)
+# Order for pABCDE: pABC (0), pABD (1), pBCD (2), pACD (3), pABE, pBCE, pACE,
+#                   pBDE, pADE, pCDE (9)
 # joint_systems3 = []
 
 # Intermediate 4-partite systems are stored
 # Order for pABCDE = pABCD (0), pABCE (1), pABDE (2), pBCDE (3), pACDE (4)
 # joint_sysems4 = []
 
+# Systems of more than 5 parties follow the same pattern: the last subsystem
+# is traced out first, then the second last, ..., then A and finally B
+# (see trace_order). separate_order(q) returns these orders as labels and
+# separate_index(q, labels) gives the position of a system in its list, so
+# separated systems can be looked up by label instead of by list position.
+
+# Separated systems are computed once each and stored by subsystem bitmask,
+# where bit i is set if subsystem i (A = bit 0, B = bit 1, ...) is kept
+# e.g. pAC = 0b101 = 5 (see class Marginals)
+
+# All functions also take a stack of density matrices of shape (batch, n, n)
+# and then return stacks of separated systems of shape (batch, m, m)
+
+# Pure states can be given as a state vector |u> of length n instead of
+# p = |u><u|. Separated systems are then computed from |u> directly, without
+# ever forming the n x n matrix p
+
+# Low rank (or spectral) states p = F F* can be given as a LowRankState of
+# thin factor F of shape (n, r), which is |u> for r = 1. Separated systems
+# are then traced from F, at a cost of O(r) times that of a state vector
+
 def separate(p,dim):
     s, j, j3, j4 = partial_trace(p, dim, [], [], [], [])
     return s, j, j3, j4
 
 
-def partial_trace(p, dim, systems, joint_systems, joint_systems3, joint_systems4):
+def separate_all(p, dim):
     """
-    Top level function that calls separate_qubit and separate_qutrit
-    to get single qubit and qutrit systems
-    dim = 2 if qubit, dim = 3 if qutrit
+    Same as separate, but also returns the lists of 5-partite (and larger)
+    joint systems for states of more than 5 qubits/qutrits.
+    Returns list [systems, joint_systems, joint_systems3, ...]
     """
-    # Check matrix is square
-    check_square_matrix(p, "separate")
+    higher = []
+    s, j, j3, j4 = partial_trace(p, dim, [], [], [], [], higher)
+    return [s, j, j3, j4] + higher
 
 
-    n = p.shape[0]
-    n2 = p.shape[1]
+def partial_trace(p, dim, systems, joint_systems, joint_systems3, joint_systems4,
+                  higher_systems=None):
+    """
+    Top level function that separates p into all of its smaller joint systems
+    and single systems
+    dim = 2 if qubit, dim = 3 if qutrit, dim = d for d-dimensional systems,
+    or a tuple of the dimension of each subsystem e.g. (2, 2, 3)
+    Joint systems of 5 or more parties are appended to higher_systems
+    """
     func_str = "separate in partial_trace.py"
-    q = check_power_of_dim(n, dim, func_str)
-
-    if(isPowerof2(dim)):
-        separate_qubit(p, systems, joint_systems, joint_systems3, joint_systems4)
+    pure = is_state_vector(p)
+    if(not pure):
+        check_square_matrix(p, func_str)
+    dims = local_dims(p.shape[-1], dim, func_str)
+    q = len(dims)
+
+    levels = [systems, joint_systems, joint_systems3, joint_systems4]
+    # Systems of 5 or more parties are only computed if asked for
+    returned = None if higher_systems is not None else len(levels)
+    if higher_systems is None:
+        higher_systems = []
+    for i in range(len(higher_systems), q - 5):
+        higher_systems.append([])
+    levels += higher_systems
+
+    batch_size = int(np.prod(p.shape[:-2]))
+    if(not pure and not is_low_rank(p) and
+       plan_size(dims) * batch_size <= max_plan_size):
+        separated = get_plan(dims).execute(p)
     else:
-        separate_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4)
+        # Only the systems returned are formed. Those of |u> (or the factor
+        # of a LowRankState) are each traced straight from it, and the
+        # largest returned systems of p are traced straight from p, so no
+        # other copy of p (or system of its size) is ever made
+        separated = marginal_levels(Marginals(p, dim), returned)
+
+    for k in range(len(separated)):
+        levels[k].extend(separated[k])
 
     return systems, joint_systems, joint_systems3, joint_systems4
 
 
-def separate_qubit(p, systems, joint_systems, joint_systems3, joint_systems4):
+def is_state_vector(p):
     """
-    Function that separates joint pure qubit quantum state p. The density matrix
-    width (and length) MUST be written as 2^q where q is the number of qubits
+    Returns true if p is a state vector |u> rather than a density matrix
+    """
+    return np.ndim(p) == 1
+
+
+def trace_out_vector(u, dims, traced):
+    """
+    Computes the partial trace of pure state |u><u| over the subsystems in
+    traced, straight from state vector |u> (see trace_out)
+    Writing |u> as a matrix M with one row per index of the kept subsystems
+    and one column per index of the traced subsystems, the result is M M*
+    u can be a stack of state vectors of shape (batch, n)
+    """
+    M = vector_matrix(u, dims, traced)
+    sub_p = np.matmul(M, np.conj(np.swapaxes(M, -1, -2)))
+    sub_p = sub_p.astype(np.complex128, copy=False)
+    if(M.ndim > 2):
+        return sub_p
+    return np.matrix(sub_p)
+
+
+def vector_matrix(u, dims, traced):
+    """
+    Reshapes state vector |u> into matrix M, where row i and column t hold the
+    amplitude of kept subsystems in state i and traced subsystems in state t
+    """
+    dims = list(dims)
+    q = len(dims)
+    keep = [i for i in range(q) if i not in traced]
+    sub_dim = int(np.prod([dims[i] for i in keep]))
+    traced_dim = int(np.prod([dims[i] for i in traced]))
+
+    u = np.asarray(u)
+    batch = u.shape[:-1]
+    b = len(batch)
+    t = u.reshape(batch + tuple(dims))
+    axes = list(range(b)) + [b + i for i in keep + traced]
+    return t.transpose(axes).reshape(batch + (sub_dim, traced_dim))
+
+
+def vector_spectrum(u, dims, traced):
+    """
+    Returns the non-zero eigenvalues (and some zeros) of the partial trace of
+    pure state |u><u| over the subsystems in traced.
+    M M* and M* M have the same non-zero eigenvalues, so the smaller of the
+    two is diagonalised (Schmidt decomposition of |u>)
+    """
+    return gram_spectrum(vector_matrix(u, dims, traced))
+
+
+def gram_spectrum(M):
+    """
+    Returns the eigenvalues of M M*, from whichever of M M* and M* M is
+    smaller (both have the same non-zero eigenvalues)
+    """
+    M_conj = np.conj(np.swapaxes(M, -1, -2))
+    if(M.shape[-2] <= M.shape[-1]):
+        G = np.matmul(M, M_conj)
+    else:
+        G = np.matmul(M_conj, M)
+    return LA.eigvalsh(G)
+
+
+class LowRankState(object):
+    """
+    Density matrix p = F F* kept as its thin factor F of shape (n, r), so
+    that p is never formed. e.g. for p = U D U*:
+        p = LowRankState(U, diag(D))
+    If values is given, the columns of vectors are orthonormal eigenvectors
+    of p with eigenvalues values, and F = vectors sqrt(values). Otherwise
+    vectors is the factor F itself
+    Marginals (and QuantumState) trace separated systems from F, and the
+    eigenvalues of p come from values or the r x r matrix F* F
+    """
+
+    def __init__(self, vectors, values=None):
+        vectors = np.asarray(vectors)
+        if(vectors.ndim == 1):
+            vectors = vectors[:, None]
+        if(values is not None):
+            values = np.asarray(values, dtype=float)
+            vectors = vectors * np.sqrt(np.clip(values, 0, None))
+        self.factor = vectors
+        self.values = values
+        self.shape = (vectors.shape[0], vectors.shape[0])
+        self.rank = vectors.shape[1]
+
+    def spectrum(self):
+        """
+        Returns the non-zero eigenvalues (and some zeros) of p
+        """
+        if(self.values is None):
+            self.values = gram_spectrum(self.factor)
+        return self.values
+
+    def dot(self, X):
+        """
+        Returns p X = F (F* X)
+        """
+        return self.factor.dot(np.conj(self.factor).T.dot(X))
+
+    def matrix(self):
+        """
+        Returns density matrix p = F F*
+        """
+        return np.matrix(np.matmul(self.factor, np.conj(self.factor).T))
+
+
+def is_low_rank(p):
+    """
+    Returns true if p is a LowRankState rather than a density matrix
     """
+    return isinstance(p, LowRankState)
 
-    dim = p.shape[0]
-    # 2^q = dim, q is the number of qubits
-    q = math.log(dim) / math.log(2)
 
-    # p_AB 2 qubits
-    if(q == 2):
-        # pA
-        pA = allocSub(p)
-        # dimensions of each sub matrix
-        sub_dim = pA.shape[0]
-        x_A = [0,2]
-        y_A = [1,3]
+def trace_out_factor(F, dims, traced):
+    """
+    Computes the partial trace of low rank state p = F F* over the subsystems
+    in traced, straight from thin factor F of shape (n, r) (see
+    trace_out_vector, which is the case r = 1)
+    """
+    M = factor_matrix(F, dims, traced)
+    sub_p = np.matmul(M, np.conj(M).T).astype(np.complex128, copy=False)
+    return np.matrix(sub_p)
+
+
+def factor_matrix(F, dims, traced):
+    """
+    Reshapes thin factor F into matrix M with sub_p = M M*, where row i and
+    column (k, t) hold the amplitude of column k of F with the kept subsystems
+    in state i and traced subsystems in state t
+    """
+    M = vector_matrix(np.asarray(F).T, dims, traced)
+    return np.swapaxes(M, 0, 1).reshape(M.shape[1], -1)
+
+
+def factor_spectrum(F, dims, traced):
+    """
+    Returns the non-zero eigenvalues (and some zeros) of the partial trace of
+    low rank state p = F F* over the subsystems in traced (see vector_spectrum)
+    """
+    return gram_spectrum(factor_matrix(F, dims, traced))
+
+
+def trace_out(p, dims, traced):
+    """
+    Computes the partial trace of p over the subsystems in traced
+    dims: list of the dimension of each subsystem e.g. [2, 2, 3]
+    traced: list of positions of the subsystems to trace out, where 0 is
+    the first (most significant) subsystem e.g. trace_out(pABC, [2,2,2], [1])
+    returns pAC
+    p can be a stack of density matrices of shape (batch, n, n)
+    """
+    dims = list(dims)
+    q = len(dims)
+    keep = [i for i in range(q) if i not in traced]
+    sub_dim = int(np.prod([dims[i] for i in keep]))
+
+    # View p as a tensor with one row and one column index per subsystem.
+    # Row index i is labelled i and column index i is labelled q + i, unless
+    # subsystem i is traced out, in which case both share label i.
+    # Leading (batch) axes are carried through by the ellipsis
+    p = np.asarray(p)
+    batch = p.shape[:-2]
+    t = p.reshape(batch + tuple(dims + dims))
+    rows = list(range(q))
+    cols = [i if i in traced else q + i for i in range(q)]
+    out = keep + [q + i for i in keep]
+
+    sub_p = np.einsum(t, [Ellipsis] + rows + cols, [Ellipsis] + out)
+    sub_p = sub_p.reshape(batch + (sub_dim, sub_dim))
+    sub_p = sub_p.astype(np.complex128, copy=False)
+    if(batch):
+        return sub_p
+    return np.matrix(sub_p)
+
+
+# Density matrices stored on disk (e.g. np.load(path, mmap_mode='r')) are
+# separated by separate_stream, which reads p a block of rows at a time so
+# that at most about max_block_bytes of p is in memory at once
+max_block_bytes = 2**26
+
+def separate_stream(p, dim, block_bytes=None):
+    """
+    Same as separate, for density matrix p stored on disk. p is an np.memmap
+    (or any array that can be sliced by rows) or the path of a .npy file
+    Only the largest systems returned are accumulated while p is read, so
+    memory is about block_bytes (default max_block_bytes) plus the size of
+    the systems returned
+    Returns systems, joint_systems, joint_systems3, joint_systems4
+    """
+    m = stream_marginals(p, dim, block_bytes=block_bytes)
+    separated = marginal_levels(m, 4)
+    levels = [[], [], [], []]
+    for k in range(len(separated)):
+        levels[k].extend(separated[k])
+    return levels[0], levels[1], levels[2], levels[3]
+
+
+def stream_marginals(p, dim, labels=None, block_bytes=None):
+    """
+    Returns Marginals of density matrix p stored on disk (see separate_stream)
+    with the systems in list labels (default: all systems of min(q - 1, 4)
+    parties, the largest returned by separate_stream) computed in a single
+    pass over p. Other systems asked of the Marginals are traced from these
+    if they contain them, and from p otherwise
+    """
+    if(isinstance(p, str)):
+        p = np.load(p, mmap_mode='r')
 
-        # pB
-        pB = allocSub(p)
-        x_B = [0,1]
-        y_B = [2,3]
+    m = Marginals(p, dim)
+    if(labels is None):
+        masks = [mask for mask in range(1, m.full)
+                 if len(mask_positions(mask)) == min(m.q - 1, 4)]
+    else:
+        masks = [system_mask(l) for l in labels]
 
-        for i in range(sub_dim):
-            for j in range(sub_dim):
-                pA[i,j] = p[x_A[i],x_A[j]] + p[y_A[i],y_A[j]]
-                pB[i,j] = p[x_B[i],x_B[j]] + p[y_B[i],y_B[j]]
+    traced = [[i for i in range(m.q) if not (mask >> i) & 1] for mask in masks]
+    for mask, sub_p in zip(masks, stream_trace_out(p, m.dims, traced, block_bytes)):
+        m.systems[mask] = sub_p
+    return m
 
 
-        if(not matrixInList(pA, systems)):
-            systems.append(pA)
-        if(not matrixInList(pB, systems)):
-            systems.append(pB)
+def stream_trace_out(p, dims, traced_list, block_bytes=None):
+    """
+    Computes the partial trace of p over each list of subsystem positions in
+    traced_list (see trace_out), reading p a block of rows at a time.
+    A block holds the rows where the first k subsystems are in fixed states
+    a, with k as small as possible so that the block fits in block_bytes
+    Returns list of the separated systems
+    """
+    if(block_bytes is None):
+        block_bytes = max_block_bytes
+    dims = list(dims)
+    q = len(dims)
+    n = int(np.prod(dims))
+
+    # Fix the states of the first k subsystems in each block
+    k = 0
+    rows = n
+    while(k < q and rows * n * p.itemsize > block_bytes):
+        rows //= dims[k]
+        k += 1
+
+    outs = []
+    for traced in traced_list:
+        keep = [i for i in range(q) if i not in traced]
+        kept_dims = [dims[i] for i in keep]
+        outs.append(np.zeros(kept_dims + kept_dims, dtype=np.complex128))
+
+    for block, a in enumerate(np.ndindex(*dims[:k])):
+        t = np.asarray(p[block * rows:(block + 1) * rows])
+        t = t.reshape(dims[k:] + dims)
+
+        for traced, out in zip(traced_list, outs):
+            keep = [i for i in range(q) if i not in traced]
+
+            # Traced subsystem i < k has its row fixed to a[i], so only the
+            # columns with the same state of i are summed
+            fixed = [i < k and i in traced for i in range(q)]
+            cols = tuple(a[i] if fixed[i] else slice(None) for i in range(q))
+            sub_t = t[(slice(None),) * (q - k) + cols]
+
+            # Row i is labelled i, column i is labelled q + i unless subsystem
+            # i is traced out, in which case both share label i
+            row_labels = list(range(k, q))
+            col_labels = [i if i in traced else q + i for i in range(q) if not fixed[i]]
+            out_labels = [i for i in keep if i >= k] + [q + i for i in keep]
+
+            # Kept subsystem i < k has its row fixed to a[i] in this block
+            out_index = tuple(a[i] if i < k else slice(None) for i in keep)
+            out[out_index] += np.einsum(sub_t, row_labels + col_labels, out_labels)
+
+    separated = []
+    for out in outs:
+        sub_dim = int(np.sqrt(out.size))
+        separated.append(np.matrix(out.reshape(sub_dim, sub_dim)))
+    return separated
+
+
+# Largest number of gathered elements (over all states in a stack) for which
+# separate uses a PartialTracePlan. Past this, the gather is slower than
+# tracing one subsystem at a time, so large systems and large stacks are
+# separated by Marginals instead
+max_plan_size = 2**17
+
+# Plans created by get_plan, stored by tuple of subsystem dimensions
+partial_trace_plans = {}
+
+def plan_size(dims):
+    """
+    Returns the number of entries of p gathered by the PartialTracePlan for
+    subsystems of dimensions dims, without creating the plan.
+    Each separated system of side sub_dim gathers sub_dim^2 * (n / sub_dim)
+    entries, so the total is n times the sum of the sides of all systems
+    """
+    n = int(np.prod(dims))
+    q = len(dims)
+    total = 0
+    for mask in range(1, (1 << q) - 1):
+        total += int(np.prod([dims[i] for i in mask_positions(mask)]))
+    return n * total
 
-    # p_ABC 3 qubits
-    elif(q == 3):
-        __separate3(p, systems, joint_systems, joint_systems3, joint_systems4)
-    elif(q == 4):
-        __separate4(p, systems, joint_systems, joint_systems3, joint_systems4)
-    elif(q == 5):
-        __separate5(p, systems, joint_systems, joint_systems3, joint_systems4)
+
+def get_plan(dims):
+    """
+    Returns the PartialTracePlan for subsystems of dimensions dims, creating it
+    on first use
+    """
+    dims = tuple(dims)
+    if(dims not in partial_trace_plans):
+        partial_trace_plans[dims] = PartialTracePlan(dims)
+    return partial_trace_plans[dims]
 
 
-def __separate3(p, systems, joint_systems, joint_systems3, joint_systems4):
-    """
-    Private method that calculates partial trace of 3 qubit systems
-    """
-
-    # pAB
-    pAB = allocSub(p)
-    # dimensions of each sub matrix
-    sub_dim = pAB.shape[0]
-
-    x_AB = [2*x for x in range(sub_dim)]
-    y_AB = [x+(2**0) for x in x_AB]
-
-    # pAC
-    pAC = allocSub(p)
-    x_AC = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%2) == 0):
-            x_AC[i] = x_AC[i-1] + (2 + 1)
-        else:
-            x_AC[i] = x_AC[i-1] + 1
-
-    y_AC = [x+(2**1) for x in x_AC]
+class PartialTracePlan(object):
+    """
+    Separates density matrices of subsystems with dimensions dims into all of
+    their separated systems, in the order given by separate_order.
+    The indices of the entries of p summed into each entry of each separated
+    system depend only on dims, so they are computed once here. Separating p
+    is then a single gather (np.take) of every entry needed, into a buffer
+    kept between calls, followed by a single np.add.reduceat.
+    """
 
-    # pBC
-    pBC = allocSub(p)
-    x_BC = [x for x in range(sub_dim)]
-    y_BC = [x+(2**2) for x in x_BC]
+    def __init__(self, dims):
+        self.dims = list(dims)
+        self.q = len(self.dims)
+        self.n = int(np.prod(self.dims))
+        self.order = separate_order(self.q)
+
+        # Row (and column) index of p for each subsystem index
+        flat = np.arange(self.n).reshape(self.dims)
+
+        index = []
+        self.shapes = []
+        for labels in [l for level in self.order for l in level]:
+            keep = list(subsystem_positions(labels))
+            traced = [i for i in range(self.q) if i not in keep]
+            sub_dim = int(np.prod([self.dims[i] for i in keep]))
+            traced_dim = self.n // sub_dim
+
+            # rows[i, t] = row of p for kept index i and traced index t
+            rows = flat.transpose(keep + traced).reshape(sub_dim, traced_dim)
+            # Entry (i, j) of the system is the sum over t of p[rows[i,t], rows[j,t]]
+            index.append((rows[:, None, :] * self.n + rows[None, :, :]).ravel())
+            self.shapes.append((sub_dim, traced_dim))
+
+        self.index = np.concatenate(index)
+        self.size = len(self.index)
+
+        # Start of each sum in the gathered buffer
+        counts = [s * s for s, t in self.shapes]
+        lengths = np.repeat([t for s, t in self.shapes], counts)
+        self.starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        # One flat gather buffer per dtype, for the largest batch seen
+        self.buffers = {}
+
+    def buffer(self, batch, dtype):
+        """
+        Returns the buffer that entries of p are gathered into, as the start
+        of the buffer of dtype, which only grows for a larger batch
+        """
+        length = int(np.prod(batch, dtype=np.int64)) * self.size
+        if(dtype not in self.buffers or len(self.buffers[dtype]) < length):
+            self.buffers[dtype] = np.empty(length, dtype=dtype)
+        return self.buffers[dtype][:length].reshape(batch + (self.size,))
+
+    def execute(self, p):
+        """
+        Returns separated systems of p as a list where element k lists the
+        (k+1)-partite systems, in the order given by separate_order
+        p can be a stack of density matrices of shape (batch, n, n)
+        """
+        p = np.asarray(p)
+        batch = p.shape[:-2]
+        flat_p = p.reshape(batch + (self.n * self.n,))
+
+        gathered = self.buffer(batch, flat_p.dtype)
+        np.take(flat_p, self.index, axis=-1, out=gathered)
+        summed = np.add.reduceat(gathered, self.starts, axis=-1)
+        summed = summed.astype(np.complex128)
+
+        # Split summed into the separated systems
+        shapes = iter(self.shapes)
+        separated = []
+        i = 0
+        for level in self.order:
+            systems = []
+            for labels in level:
+                sub_dim, _ = next(shapes)
+                sub_p = summed[..., i:i + sub_dim * sub_dim]
+                sub_p = sub_p.reshape(batch + (sub_dim, sub_dim))
+                systems.append(sub_p if batch else np.matrix(sub_p))
+                i += sub_dim * sub_dim
+            separated.append(systems)
+        return separated
+
+
+class Marginals(SystemLattice):
+    """
+    Computes separated systems of quantum state p on demand, so that only the
+    systems asked for are computed. e.g.
+        m = Marginals(pABCD, 2)
+        pA, pCD = m['A'], m['CD']
+    Systems are stored by bitmask (see system_mask). Each system is computed
+    once and traced from the smallest system already computed that contains
+    it (see SystemLattice in utils.py).
+    dim = 2 if qubit, dim = 3 if qutrit, dim = d for d-dimensional systems,
+    or a tuple of the dimension of each subsystem e.g. (2, 2, 3)
+    If pure is true (or p is 1 dimensional), p is a state vector |u> (or a
+    stack of them) and every system is traced straight from |u>
+    If p is a LowRankState, every system is traced straight from its factor
+    """
 
-    for i in range(sub_dim):
-        for j in range(sub_dim):
-            pAB[i,j] = p[x_AB[i],x_AB[j]] + p[y_AB[i],y_AB[j]]
-            pBC[i,j] = p[x_BC[i],x_BC[j]] + p[y_BC[i],y_BC[j]]
-            pAC[i,j] = p[x_AC[i],x_AC[j]] + p[y_AC[i],y_AC[j]]
+    func_str = "get_mask in partial_trace.py"
+
+    def __init__(self, p, dim, pure=None):
+        func_str = "Marginals in partial_trace.py"
+        if(pure is None):
+            pure = is_state_vector(p)
+        low_rank = is_low_rank(p)
+        if(not pure and not low_rank):
+            check_square_matrix(p, func_str)
+        SystemLattice.__init__(self, local_dims(p.shape[-1], dim, func_str))
+
+        self.p = p
+        self.pure = pure
+        self.low_rank = low_rank
+        self.dim = dim
+        if(not pure and not low_rank):
+            self.systems[self.full] = p
+
+    def compute_mask(self, mask):
+        """
+        Returns the density matrix of the system with the given bitmask,
+        traced straight from |u> or the factor of a LowRankState if p is one
+        """
+        traced = [i for i in range(self.q) if not (mask >> i) & 1]
+        if(self.pure):
+            return trace_out_vector(self.p, self.dims, traced)
+        if(self.low_rank):
+            return trace_out_factor(self.p.factor, self.dims, traced)
+        return SystemLattice.compute_mask(self, mask)
+
+    def trace(self, parent, positions, traced):
+        return trace_out(parent, [self.dims[s] for s in positions], traced)
 
-    # Storing intermediiate joint systems
-    if(not matrixInList(pAB, joint_systems)):
-        joint_systems.append(pAB)
-    if(not matrixInList(pBC, joint_systems)):
-        joint_systems.append(pBC)
-    if(not matrixInList(pAC, joint_systems)):
-        joint_systems.append(pAC)
 
-    # Separate joint systems into single systems
-    separate_qubit(pAB, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pBC, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pAC, systems, joint_systems, joint_systems3, joint_systems4)
-
-
-def __separate4(p, systems, joint_systems, joint_systems3, joint_systems4):
+def separate_qubit(p, systems, joint_systems, joint_systems3, joint_systems4):
+    """
+    Function that separates joint qubit quantum state p. The density matrix
+    width (and length) MUST be written as 2^q where q is the number of qubits
     """
-    Private method that calculates separate systems for 4 qubit systems
-    """
-
-    # pABC
-    pABC = allocSub(p)
-
-    # dimensions of each sub matrix
-    sub_dim = pABC.shape[0]
-
-    x_ABC = [2*x for x in range(sub_dim)]
-    y_ABC = [x+(2**0) for x in x_ABC]
-
-    # pABD
-    pABD = allocSub(p)
-    x_ABD = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%2) == 0):
-            x_ABD[i] = x_ABD[i-1] + (2 + 1)
-        else:
-            x_ABD[i] = x_ABD[i-1] + 1
-
-    y_ABD = [x+(2**1) for x in x_ABD]
-
-    # pACD
-    pACD = allocSub(p)
-    x_ACD = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%4) == 0):
-            x_ACD[i] = x_ACD[i-1] + (2*2 + 1)
-        else:
-            x_ACD[i] = x_ACD[i-1] + 1
-
-    y_ACD = [x+(2**2) for x in x_ACD]
-
-    # pBCD
-    pBCD = allocSub(p)
-    x_BCD = [x for x in range(sub_dim)]
-    y_BCD = [x+(2**3) for x in x_BCD]
-
-    # Fill in matrix pABC, pABD, pBCD and pACD
-    for i in range(sub_dim):
-        for j in range(sub_dim):
-            pABC[i,j] = p[x_ABC[i],x_ABC[j]] + p[y_ABC[i],y_ABC[j]]
-            pABD[i,j] = p[x_ABD[i],x_ABD[j]] + p[y_ABD[i],y_ABD[j]]
-            pBCD[i,j] = p[x_BCD[i],x_BCD[j]] + p[y_BCD[i],y_BCD[j]]
-            pACD[i,j] = p[x_ACD[i],x_ACD[j]] + p[y_ACD[i],y_ACD[j]]
-
-    # Storing intermediiate joint systems
-    if(not matrixInList(pABC, joint_systems3)):
-        joint_systems3.append(pABC)
-    if(not matrixInList(pABD, joint_systems3)):
-        joint_systems3.append(pABD)
-    if(not matrixInList(pBCD, joint_systems3)):
-        joint_systems3.append(pBCD)
-    if(not matrixInList(pACD, joint_systems3)):
-        joint_systems3.append(pACD)
-
-    # Separate joint systems into single systems
-    separate_qubit(pABC, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pABD, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pBCD, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pACD, systems, joint_systems, joint_systems3, joint_systems4)
-
-
-def __separate5(p, systems, joint_systems, joint_systems3, joint_systems4):
-    """
-    Private method that calculates separate systems for 5 qubit systems
-    """
-
-    # pABCD
-    pABCD = allocSub(p)
-
-    # dimensions of each sub matrix
-    sub_dim = pABCD.shape[0]
-
-    x_ABCD = [2*x for x in range(sub_dim)]
-    y_ABCD = [x+(2**0) for x in x_ABCD]
-
-    # pABCE
-    pABCE = allocSub(p)
-    x_ABCE = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%2) == 0):
-            x_ABCE[i] = x_ABCE[i-1] + (2 + 1)
-        else:
-            x_ABCE[i] = x_ABCE[i-1] + 1
-
-    y_ABCE = [x+(2**1) for x in x_ABCE]
-
-    # pABDE
-    pABDE = allocSub(p)
-    x_ABDE = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%4) == 0):
-            x_ABDE[i] = x_ABDE[i-1] + (2*2 + 1)
-        else:
-            x_ABDE[i] = x_ABDE[i-1] + 1
-
-    y_ABDE = [x+(2**2) for x in x_ABDE]
-
-    # pACDE
-    pACDE = allocSub(p)
-    x_ACDE = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%8) == 0):
-            x_ACDE[i] = x_ACDE[i-1] + (4*2 + 1)
-        else:
-            x_ACDE[i] = x_ACDE[i-1] + 1
-
-    y_ACDE = [x+(2**3) for x in x_ACDE]
-
-    # pBCD
-    pBCDE = allocSub(p)
-    x_BCDE = [x for x in range(sub_dim)]
-    y_BCDE = [x+(2**4) for x in x_BCDE]
-
-    # Fill in matrix pABC, pABD, pBCD and pACD
-    for i in range(sub_dim):
-        for j in range(sub_dim):
-            pABCD[i,j] = p[x_ABCD[i],x_ABCD[j]] + p[y_ABCD[i],y_ABCD[j]]
-            pABCE[i,j] = p[x_ABCE[i],x_ABCE[j]] + p[y_ABCE[i],y_ABCE[j]]
-            pABDE[i,j] = p[x_ABDE[i],x_ABDE[j]] + p[y_ABDE[i],y_ABDE[j]]
-            pBCDE[i,j] = p[x_BCDE[i],x_BCDE[j]] + p[y_BCDE[i],y_BCDE[j]]
-            pACDE[i,j] = p[x_ACDE[i],x_ACDE[j]] + p[y_ACDE[i],y_ACDE[j]]
-
-    # Storing intermediiate joint systems
-    if(not matrixInList(pABCD, joint_systems4)):
-        joint_systems4.append(pABCD)
-    if(not matrixInList(pABCE, joint_systems4)):
-        joint_systems4.append(pABCE)
-    if(not matrixInList(pABDE, joint_systems4)):
-        joint_systems4.append(pABDE)
-    if(not matrixInList(pBCDE, joint_systems4)):
-        joint_systems4.append(pBCDE)
-    if(not matrixInList(pACDE, joint_systems4)):
-        joint_systems4.append(pACDE)
-
-    # Separate joint systems into single systems
-    separate_qubit(pABCD, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pABCE, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pABDE, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pBCDE, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qubit(pACDE, systems, joint_systems, joint_systems3, joint_systems4)
+    partial_trace(p, 2, systems, joint_systems, joint_systems3, joint_systems4)
 
 
 # Separate qutrit <0|, <1|, <2|
 def separate_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4):
     """
-    Function that separates joint pure qutrit quantum state p. The density
+    Function that separates joint qutrit quantum state p. The density
     matrix width (and length) MUST be written as 3^q where q is the number
     of qutrits
     """
-
-    dim = p.shape[0]
-    # 3^q = dim, q is the number of qutrits
-    q = math.log(dim) / math.log(3)
-
-    # p_AB 2 qutrits
-    if(q == 2):
-        # pA
-        pA = allocSub(p)
-        # dimensions of each sub matrix
-        sub_dim = pA.shape[0]
-
-        x_A = [3*x for x in range(sub_dim)]
-        y_A = [x+1 for x in x_A]
-        z_A = [x+1 for x in y_A]
-
-        # pB
-        pB = allocSub(p)
-        x_B = [x for x in range(sub_dim)]
-        y_B = [x+sub_dim for x in x_B]
-        z_B = [x+sub_dim for x in y_B]
-
-        # Fill in matrix pA and pB
-        for i in range(sub_dim):
-            for j in range(sub_dim):
-                pA[i,j] = p[x_A[i],x_A[j]] + p[y_A[i],y_A[j]] + p[z_A[i],z_A[j]]
-                pB[i,j] = p[x_B[i],x_B[j]] + p[y_B[i],y_B[j]] + p[z_B[i],z_B[j]]
-
-        # Store in list
-        if(not matrixInList(pA, systems)):
-            systems.append(pA)
-        if(not matrixInList(pB, systems)):
-            systems.append(pB)
-
-    # p_ABC 3 qutrits
-    elif(q == 3):
-        __separate3_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4)
-    elif(q == 4):
-        __separate4_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4)
-    elif(q == 5 or isclose(q,5)):
-        __separate5_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4)
-
-
-def __separate3_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4):
-    """
-    Private method that calculates separate systems for 3 qutrit systems
-    """
-
-    #pAB
-    pAB = allocSub(p)
-
-    # dimensions of each sub matrix
-    sub_dim = pAB.shape[0]
-    x_AB = [3*x for x in range(sub_dim)]
-    y_AB = [x+(3**0) for x in x_AB]
-    z_AB = [x+(3**0) for x in y_AB]
-
-    # pAC
-    pAC = allocSub(p)
-    x_AC = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%3) == 0):
-            x_AC[i] = x_AC[i-1] + (3*2 + 1)
-        else:
-            x_AC[i] = x_AC[i-1] + 1
-
-    y_AC = [x+(3**1) for x in x_AC]
-    z_AC = [x+(3**1) for x in y_AC]
-
-    # pBC
-    pBC = allocSub(p)
-    x_BC = [x for x in range(sub_dim)]
-    y_BC = [x+(3**2) for x in x_BC]
-    z_BC = [x+(3**2) for x in y_BC]
-
-    # Fill in matrix pAB, pBC and pAC
-    for i in range(sub_dim):
-        for j in range(sub_dim):
-            pAB[i,j] = p[x_AB[i],x_AB[j]] + p[y_AB[i],y_AB[j]] + p[z_AB[i],z_AB[j]]
-            pBC[i,j] = p[x_BC[i],x_BC[j]] + p[y_BC[i],y_BC[j]] + p[z_BC[i],z_BC[j]]
-            pAC[i,j] = p[x_AC[i],x_AC[j]] + p[y_AC[i],y_AC[j]] + p[z_AC[i],z_AC[j]]
-
-    # Storing intermediiate joint systems
-    if(not matrixInList(pAB, joint_systems)):
-        joint_systems.append(pAB)
-    if(not matrixInList(pBC, joint_systems)):
-        joint_systems.append(pBC)
-    if(not matrixInList(pAC, joint_systems)):
-        joint_systems.append(pAC)
-
-    # Recursively separate further
-    separate_qutrit(pAB, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pBC, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pAC, systems, joint_systems, joint_systems3, joint_systems4)
-
-
-def __separate4_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4):
-    """
-    Private method that calculates separate systems for 4 qutrit systems
-    """
-
-    #pABC
-    pABC = allocSub(p)
-    sub_dim = pABC.shape[0]
-    x_ABC = [3*x for x in range(sub_dim)]
-    y_ABC = [x+(3**0) for x in x_ABC]
-    z_ABC = [x+(3**0) for x in y_ABC]
-
-    #pABD
-    pABD = allocSub(p)
-    x_ABD = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%3) == 0):
-            x_ABD[i] = x_ABD[i-1] + (3*2 + 1)
-        else:
-            x_ABD[i] = x_ABD[i-1] + 1
-
-    y_ABD = [x+(3**1) for x in x_ABD]
-    z_ABD = [x+(3**1) for x in y_ABD]
-
-    #pACD
-    pACD = allocSub(p)
-    x_ACD = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%9) == 0):
-            x_ACD[i] = x_ACD[i-1] + (9*2 + 1)
-        else:
-            x_ACD[i] = x_ACD[i-1] + 1
-
-    y_ACD = [x+(3**2) for x in x_ACD]
-    z_ACD = [x+(3**2) for x in y_ACD]
-
-    #pBCD
-    pBCD = allocSub(p)
-    x_BCD = [x for x in range(sub_dim)]
-    y_BCD = [x+(3**3) for x in x_BCD]
-    z_BCD = [x+(3**3) for x in y_BCD]
-
-    # Fill in matrix pABC, pABD, pBCD and pACD
-    for i in range(sub_dim):
-        for j in range(sub_dim):
-            pABC[i,j] = p[x_ABC[i],x_ABC[j]] + p[y_ABC[i],y_ABC[j]] + p[z_ABC[i],z_ABC[j]]
-            pABD[i,j] = p[x_ABD[i],x_ABD[j]] + p[y_ABD[i],y_ABD[j]] + p[z_ABD[i],z_ABD[j]]
-            pBCD[i,j] = p[x_BCD[i],x_BCD[j]] + p[y_BCD[i],y_BCD[j]] + p[z_BCD[i],z_BCD[j]]
-            pACD[i,j] = p[x_ACD[i],x_ACD[j]] + p[y_ACD[i],y_ACD[j]] + p[z_ACD[i],z_ACD[j]]
-
-
-    # Storing intermediiate joint systems
-    if(not matrixInList(pABC, joint_systems3)):
-        joint_systems3.append(pABC)
-    if(not matrixInList(pABD, joint_systems3)):
-        joint_systems3.append(pABD)
-    if(not matrixInList(pBCD, joint_systems3)):
-        joint_systems3.append(pBCD)
-    if(not matrixInList(pACD, joint_systems3)):
-        joint_systems3.append(pACD)
-
-
-    # Recursively separate further
-    separate_qutrit(pABC, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pABD, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pBCD, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pACD, systems, joint_systems, joint_systems3, joint_systems4)
-
-
-def __separate5_qutrit(p, systems, joint_systems, joint_systems3, joint_systems4):
-    """
-    Private method that calculates separate systems for 5 qutrit systems
-    """
-
-    #pABCD
-    pABCD = allocSub(p)
-    sub_dim = pABCD.shape[0]
-    x_ABCD = [3*x for x in range(sub_dim)]
-    y_ABCD = [x+(3**0) for x in x_ABCD]
-    z_ABCD = [x+(3**0) for x in y_ABCD]
-
-    #pABCE
-    pABCE = allocSub(p)
-    x_ABCE = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%3) == 0):
-            x_ABCE[i] = x_ABCE[i-1] + (3*2 + 1)
-        else:
-            x_ABCE[i] = x_ABCE[i-1] + 1
-
-    y_ABCE = [x+(3**1) for x in x_ABCE]
-    z_ABCE = [x+(3**1) for x in y_ABCE]
-
-    #pABDE
-    pABDE = allocSub(p)
-    x_ABDE = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%9) == 0):
-            x_ABDE[i] = x_ABDE[i-1] + (9*2 + 1)
-        else:
-            x_ABDE[i] = x_ABDE[i-1] + 1
-
-    y_ABDE = [x+(3**2) for x in x_ABDE]
-    z_ABDE = [x+(3**2) for x in y_ABDE]
-
-    #pACDE
-    pACDE = allocSub(p)
-    x_ACDE  = [0 for x in range(sub_dim)]
-    for i in range(1,sub_dim):
-        if((i%27) == 0):
-            x_ACDE [i] = x_ACDE[i-1] + (27*2 + 1)
-        else:
-            x_ACDE [i] = x_ACDE[i-1] + 1
-
-    y_ACDE = [x+(3**3) for x in x_ACDE]
-    z_ACDE = [x+(3**3) for x in y_ACDE]
-
-    #pBCDE
-    pBCDE = allocSub(p)
-    x_BCDE = [x for x in range(sub_dim)]
-    y_BCDE = [x+(3**4) for x in x_BCDE]
-    z_BCDE = [x+(3**4) for x in y_BCDE]
-
-    # Fill in matrix pABCD, pABCE, pABDE, pBCDE and pACDE
-    for i in range(sub_dim):
-        for j in range(sub_dim):
-            pABCD[i,j] = p[x_ABCD[i],x_ABCD[j]] + p[y_ABCD[i],y_ABCD[j]] + p[z_ABCD[i],z_ABCD[j]]
-            pABCE[i,j] = p[x_ABCE[i],x_ABCE[j]] + p[y_ABCE[i],y_ABCE[j]] + p[z_ABCE[i],z_ABCE[j]]
-            pABDE[i,j] = p[x_ABDE[i],x_ABDE[j]] + p[y_ABDE[i],y_ABDE[j]] + p[z_ABDE[i],z_ABDE[j]]
-            pBCDE[i,j] = p[x_BCDE[i],x_BCDE[j]] + p[y_BCDE[i],y_BCDE[j]] + p[z_BCDE[i],z_BCDE[j]]
-            pACDE[i,j] = p[x_ACDE[i],x_ACDE[j]] + p[y_ACDE[i],y_ACDE[j]] + p[z_ACDE[i],z_ACDE[j]]
-
-    # Storing intermediiate joint systems
-    if(not matrixInList(pABCD, joint_systems4)):
-        joint_systems4.append(pABCD)
-    if(not matrixInList(pABCE, joint_systems4)):
-        joint_systems4.append(pABCE)
-    if(not matrixInList(pABDE, joint_systems4)):
-        joint_systems4.append(pABDE)
-    if(not matrixInList(pBCDE, joint_systems4)):
-        joint_systems4.append(pBCDE)
-    if(not matrixInList(pACDE, joint_systems4)):
-        joint_systems4.append(pACDE)
-
-    # Recursively separate further
-    separate_qutrit(pABCD, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pABCE, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pABDE, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pBCDE, systems, joint_systems, joint_systems3, joint_systems4)
-    separate_qutrit(pACDE, systems, joint_systems, joint_systems3, joint_systems4)
+    partial_trace(p, 3, systems, joint_systems, joint_systems3, joint_systems4)
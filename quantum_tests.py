@@ -1,7 +1,12 @@
 from entropy import *
 from generate_random_quantum import *
 from evolution import *
+from partial_trace import stream_trace_out, trace_out, separate_stream
+from non_shannon_quantum import *
 import time
+import os
+import tempfile
+import tracemalloc
 
 # TEST UNITARY <ATRIX IS UNITARY
 def test_unitary(u):
@@ -85,10 +90,10 @@ def test_defs_true(gen_func, test_func, lim):
 # TEST ENTROPY IN PURE STATE IS ZERO
 def test_pure_state_entropy_is_zero(p):
     """
-    Returns true if vonNeumann entropy of pure state is zero
+    Returns true if vonNeumann entropy of pure state is zero i.e. tr(p^2) = 1
+    (see is_pure), which needs no eigensolve
     """
-    vn = vonNeumann(p)
-    assert is_close_to_zero(vn) == True
+    assert is_pure(p) == True
 
 # TEST RELATIVE ENTROPY NON-NEGATIVE
 def test_relative_entropy_non_negative(p,r):
@@ -102,6 +107,41 @@ def test_relative_entropy_non_negative(p,r):
     assert is_close_to_zero(re) == True
 
 
+# TEST RELATIVE ENTROPY IS INFINITE IF SUPPORT OF P NOT IN SUPPORT OF R
+def test_relative_entropy_support(lim):
+    """
+    p is a mixed state and r a pure state, so S(p||r) is infinite and S(r||p)
+    is finite. Same for stacks of p and r, and for r given as a state vector
+    """
+    start_time = time.time()
+    for i in range(lim):
+        for n, dim in [(2**2, 2), (2**3, 2), (3**2, 3)]:
+            p = np.asarray(generate(n))
+            u = generate_pure_vector(n)
+            r = np.outer(u, np.conj(u))
+            assert relative_entropy(p, r) == np.inf
+            assert np.isfinite(relative_entropy(r, p))
+
+            res = relative_entropy(np.array([p, r]), np.array([r, p]))
+            assert res[0] == np.inf
+            assert np.isclose(res[1], relative_entropy(r, p))
+
+            # State vector |u> and QuantumState of it in place of |u><u|
+            p_state = QuantumState(p, dim)
+            u_state = QuantumState(u, dim)
+            assert relative_entropy(p_state, u_state) == np.inf
+            assert np.isclose(relative_entropy(u_state, p_state), relative_entropy(r, p))
+            assert np.isclose(relative_entropy(u, p), relative_entropy(r, p))
+            assert np.isclose(u_state.relative_entropy(p_state, 'A'),
+                              relative_entropy(u_state['A'], p_state['A']))
+            # S(p||p) = 0 diagonalising p once
+            assert is_close_to_zero(relative_entropy(p_state, p_state))
+            assert p_state.full not in p_state.spectra
+
+    print("%d of each of 2,3 qubit states and 2 qutrit states tested" % (lim))
+    print("test_relative_entropy_support: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
 # TEST RELATIVE ENTROPY INEQUALITIES
 def test_re(gen_func, test_func, lim):
     start_time = time.clock()
@@ -218,10 +258,10 @@ def test_entropy_more(gen_func, channel_func, lim):
     start_time = time.clock()
     for i in range(lim):
         p2 = gen_func(2) # 1-qubit state
-        prob = 0
-        for i in range(11):
-            assert is_CPTP_entropy_more(channel_func,p2, prob) == True
-            prob = prob + 0.1
+        probs = np.linspace(0, 1, 11)
+        holds = is_CPTP_entropy_more_sweep(channel_func, p2, probs)
+        assert np.all(holds)
+        assert list(holds) == [is_CPTP_entropy_more(channel_func, p2, prob) for prob in probs]
 
     print("%d of 1-qubit states tested" % (lim))
     print("is_CPTP_entropy_more %s: --- PASSED in %s seconds ---" % (channel_func, time.clock() - start_time))
@@ -276,3 +316,347 @@ def test_non_shannon(gen_func, test_func, lim):
 
     print("%d of each of 4 qubit and qutrit states tested" % (lim))
     print("%s: --- PASSED in %s seconds ---" % (test_func, time.clock() - start_time))
+
+
+# TEST ALL NON SHANNON INEQUALITIES ON STACKS OF STATES
+non_shannon_funcs = [non_shannon_1, non_shannon_2, non_shannon_3, non_shannon_4,
+                     non_shannon_5, non_shannon_6, non_shannon_7]
+
+def test_non_shannon_all(gen_func, lim, block=1000):
+    start_time = time.time()
+    for dim in [2, 3]:
+        tested = 0
+        while(tested < lim):
+            size = min(block, lim - tested)
+            ps = np.array([np.asarray(gen_func(dim**4)) for i in range(size)])
+            res, diff = non_shannon_all(ps, dim)
+            assert np.all(res) == True
+            # diff of a few states is RHS - LHS of each inequality checked
+            # on its own
+            for i in range(min(3, size)):
+                one_by_one = [f(ps[i], dim)[1] for f in non_shannon_funcs]
+                assert np.allclose(diff[i], one_by_one)
+            tested += size
+
+    print("%d of each of 4 qubit and qutrit states tested" % (lim))
+    print("test_non_shannon_all %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+# TEST SEPARATING A STACK OF STATES GIVES SAME SYSTEMS AS ONE STATE AT A TIME
+def test_batch_separate(gen_func, lim):
+    start_time = time.time()
+    for dim, q in [(2, 2), (2, 3), (2, 4), (2, 5), (3, 2), (3, 3), (3, 4)]:
+        ps = np.array([np.asarray(gen_func(dim**q)) for i in range(lim)])
+        batch_lists = separate(ps, dim)
+        for i in range(lim):
+            lists = separate(ps[i], dim)
+            for batch_list, l in zip(batch_lists, lists):
+                for batch_sys, sys in zip(batch_list, l):
+                    assert np.allclose(batch_sys[i], sys)
+
+    print("%d of each of 2 - 5 qubit and 2 - 4 qutrit states tested" % (lim))
+    print("test_batch_separate %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_pure_vector_separate(lim):
+    start_time = time.time()
+    for dim, q in [(2, 2), (2, 3), (2, 4), (2, 5), (3, 2), (3, 3), (3, 4)]:
+        for i in range(lim):
+            u = generate_pure_vector(dim**q)
+            p = np.outer(u, np.conj(u))
+            vector_lists = separate(u, dim)
+            lists = separate(p, dim)
+            for vector_list, l in zip(vector_lists, lists):
+                for vector_sys, sys in zip(vector_list, l):
+                    assert np.allclose(vector_sys, sys)
+            assert np.isclose(pure_entropy(u, dim, 'A'), vonNeumann(lists[0][0]))
+
+    print("%d of each of 2 - 5 qubit and 2 - 4 qutrit states tested" % (lim))
+    print("test_pure_vector_separate: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_pure_vector_separate_memory(q=12):
+    """
+    Separating a state vector of q qubits only forms the systems returned,
+    so peak memory is close to their size and far below that of |u><u|
+    """
+    start_time = time.time()
+    u = np.random.randn(2**q) + 1j * np.random.randn(2**q)
+    u = u / LA.norm(u)
+    tracemalloc.start()
+    lists = separate(u, 2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    returned = sum(sys.nbytes for l in lists for sys in l)
+    assert peak <= 2 * returned
+    # |u><u| takes 16 * 4^q bytes
+    assert peak <= 4**q
+
+    print("%d qubit state vector separated with peak memory %d bytes" % (q, peak))
+    print("test_pure_vector_separate_memory: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_separate_memory(q=10):
+    """
+    Separating a density matrix of q qubits traces the systems returned
+    straight from p, so peak memory is close to their size and no copy of p
+    is made
+    """
+    start_time = time.time()
+    A = np.random.randn(2**q, 2**q) + 1j * np.random.randn(2**q, 2**q)
+    p = A.dot(np.conj(A).T)
+    p = p / np.trace(p)
+    tracemalloc.start()
+    lists = separate(p, 2)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    returned = sum(sys.nbytes for l in lists for sys in l)
+    assert peak <= 2 * returned
+    assert peak <= p.nbytes / 8
+
+    print("%d qubit density matrix separated with peak memory %d bytes" % (q, peak))
+    print("test_separate_memory: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_stream_separate(gen_func, lim):
+    start_time = time.time()
+    path = os.path.join(tempfile.mkdtemp(), "p.npy")
+    for dim, q in [(2, 2), (2, 3), (2, 4), (2, 5), (3, 2), (3, 3), (3, 4)]:
+        for i in range(lim):
+            p = np.asarray(gen_func(dim**q))
+            np.save(path, p)
+            p_disk = np.load(path, mmap_mode='r')
+            # Small blocks so that p is read in many blocks
+            traced_list = [[i] for i in range(q)]
+            disk_systems = stream_trace_out(p_disk, [dim] * q, traced_list, 64 * dim**q)
+            for traced, sub_p in zip(traced_list, disk_systems):
+                assert np.allclose(sub_p, trace_out(p, [dim] * q, traced))
+
+            stream_lists = separate_stream(path, dim)
+            lists = separate(p, dim)
+            for stream_list, l in zip(stream_lists, lists):
+                for stream_sys, sys in zip(stream_list, l):
+                    assert np.allclose(stream_sys, sys)
+    os.remove(path)
+
+    print("%d of each of 2 - 5 qubit and 2 - 4 qutrit states tested" % (lim))
+    print("test_stream_separate %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_stream_separate_memory(q=10, block_bytes=2**20):
+    """
+    Separating a density matrix of q qubits stored on disk keeps about
+    block_bytes of it in memory, plus the systems returned
+    """
+    start_time = time.time()
+    path = os.path.join(tempfile.mkdtemp(), "p.npy")
+    A = np.random.randn(2**q, 2**q) + 1j * np.random.randn(2**q, 2**q)
+    p = A.dot(np.conj(A).T)
+    np.save(path, p / np.trace(p))
+    del A, p
+    tracemalloc.start()
+    lists = separate_stream(path, 2, block_bytes)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    os.remove(path)
+    returned = sum(sys.nbytes for l in lists for sys in l)
+    assert peak <= block_bytes + 2 * returned
+
+    print("%d qubit density matrix on disk separated with peak memory %d bytes" % (q, peak))
+    print("test_stream_separate_memory: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_batch_vonNeumann(gen_func, lim):
+    start_time = time.time()
+    for n in [4, 8, 9, 16, 27]:
+        ps = np.array([np.asarray(gen_func(n)) for i in range(lim)])
+        S = vonNeumann(ps)
+        for i in range(lim):
+            assert np.isclose(S[i], vonNeumann(ps[i]))
+
+    print("%d of each of 4, 8, 9, 16, 27 dim states tested" % (lim))
+    print("test_batch_vonNeumann %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_quantum_state_shared(gen_func, lim):
+    start_time = time.time()
+    non_shannon = [non_shannon_1, non_shannon_2, non_shannon_3, non_shannon_4,
+                   non_shannon_5, non_shannon_6, non_shannon_7]
+    for dim in [2, 3]:
+        for i in range(lim):
+            p = gen_func(dim**4)
+            state = QuantumState(p, dim)
+            for f in non_shannon:
+                assert np.isclose(f(state, dim)[1], f(p, dim)[1])
+            # Functions of a single state use the cached values of the state
+            for f in [vonNeumann, is_non_neg_VN, is_vn_leq_log, purity,
+                      renyi_2_entropy, is_pure]:
+                assert np.isclose(f(state), f(p))
+            assert np.allclose(renyi_entropy(state, [0.5, 2]), renyi_entropy(p, [0.5, 2]))
+            assert np.allclose(tsallis_entropy(state, [0.5, 2]), tsallis_entropy(p, [0.5, 2]))
+            # One entropy for each of the 15 systems of pABCD
+            assert len(state.entropies) <= 16
+
+    print("%d of each of 4 qubit and 4 qutrit states tested" % (lim))
+    print("test_quantum_state_shared %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_entropy_vector(gen_func, lim):
+    start_time = time.time()
+    for dim, q in [(2, 2), (2, 3), (2, 4), (2, 5), (3, 2), (3, 3), (3, 4)]:
+        ps = np.array([np.asarray(gen_func(dim**q)) for i in range(lim)])
+        vectors = entropy_vector(ps, dim)
+        for i in range(lim):
+            m = Marginals(ps[i], dim)
+            for j, labels in enumerate(vector_labels(q)):
+                assert np.isclose(vectors[i, j], vonNeumann(m[labels]))
+
+    print("%d of each of 2 - 5 qubit and 2 - 4 qutrit states tested" % (lim))
+    print("test_entropy_vector %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_renyi_limit(gen_func, lim):
+    start_time = time.time()
+    alpha = [0.5, 1, 2, np.inf]
+    for n in [4, 8, 9, 16, 27]:
+        for i in range(lim):
+            p = gen_func(n)
+            # von Neumann entropy without leaving out eigenvalues below 0.0001
+            # (see rounding_tolerance)
+            S = spectrum_entropy(np.clip(spectrum(p), 0, None), rounding_tolerance)
+            if(np.all(np.abs(spectrum(p)) > 0.0001)):
+                assert np.isclose(S, vonNeumann(p))
+            renyi = renyi_entropy(p, alpha)
+            # Renyi entropy is non-increasing in alpha and is S at alpha = 1
+            assert np.isclose(renyi[1], S)
+            assert np.isclose(renyi_entropy(p, 1 + 1e-8), S, atol=1e-5)
+            assert np.all(np.diff(renyi) <= 1e-9)
+            assert np.isclose(tsallis_entropy(p, 1), S * np.log(2))
+            assert np.isclose(renyi_2_entropy(p), renyi[2])
+
+    print("%d of each of 4, 8, 9, 16, 27 dim states tested" % (lim))
+    print("test_renyi_limit %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_renyi_small_eigenvalues(lim):
+    """
+    Renyi and Tsallis entropies of orders alpha < 1 (and alpha = 0) of states
+    with eigenvalues below 0.0001, which dominate tr(p^alpha)
+    """
+    start_time = time.time()
+    alpha = [0, 0.25, 0.5, 1, 2, np.inf]
+    for i in range(lim):
+        for n in [4, 16, 64]:
+            # One large eigenvalue and n - 1 small ones
+            small = np.random.uniform(1e-9, 1e-5, n - 1)
+            values = np.concatenate([[1 - np.sum(small)], small])
+            p = np.diag(values)
+            renyi = renyi_entropy(p, alpha)
+            assert np.isclose(renyi[0], np.log2(n))
+            assert np.isclose(renyi[2], 2 * np.log2(np.sum(np.sqrt(values))))
+            assert np.isclose(renyi[3], -np.sum(values * np.log2(values)))
+            assert np.all(renyi >= 0)
+            assert np.all(np.diff(renyi) <= 1e-12)
+            tsallis = tsallis_entropy(p, alpha[:3])
+            assert np.isclose(tsallis[0], n - 1)
+            assert np.isclose(tsallis[2], 2 * (np.sum(np.sqrt(values)) - 1))
+
+    # Maximally mixed state of 14 qubits, all of whose eigenvalues are below
+    # 0.0001: S_alpha = 14 for every alpha
+    values = np.full(2**14, 2.0**-14)
+    assert np.allclose(spectrum_renyi(values, alpha), 14)
+
+    print("%d of each of 4, 16, 64 dim states tested" % (lim))
+    print("test_renyi_small_eigenvalues: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_slq_entropy(rank, lim, n=512, tol=0.05):
+    start_time = time.time()
+    within = 0
+    for i in range(lim):
+        G = np.random.randn(n, rank) + 1j * np.random.randn(n, rank)
+        p = np.matmul(G, np.conj(G).T)
+        p = p / np.trace(p).real
+        values = spectrum(p)
+        S = -np.sum(values * np.log2(np.clip(values, 1e-300, None)))
+        if(abs(slq_entropy(p, tol) - S) <= tol):
+            within = within + 1
+
+    # Each estimate is within tol with about 95% confidence, so at least 3/4
+    # of them are with overwhelming probability
+    assert within >= 0.75 * lim
+
+    print("%d rank %d states of dim %d tested, %d within tol" % (lim, rank, n, within))
+    print("test_slq_entropy: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_slq_quantum_state(tol=0.05):
+    start_time = time.time()
+    # p = pA (x) pB...K, with pB...K having many eigenvalues below 0.0001
+    n = slq_min_size
+    G = np.random.randn(n // 2, n // 2) + 1j * np.random.randn(n // 2, n // 2)
+    rest_p = np.matmul(G, np.conj(G).T)
+    rest_p = rest_p / np.trace(rest_p).real
+    p = np.kron(np.diag([0.7, 0.3]), rest_p)
+
+    # Only systems of size >= slq_min_size are estimated, others diagonalised
+    m = QuantumState(p, 2, tol=tol)
+    S = m.entropy(mask_labels(m.full))
+    S_A = m.entropy('A')
+    assert m.full not in m.spectra
+    assert 1 in m.spectra
+    assert np.isclose(S_A, vonNeumann(m['A'], tol))
+    values = np.clip(spectrum(p), 1e-300, None)
+    S_exact = -np.sum(values * np.log2(values))
+    assert abs(S - S_exact) <= 2 * tol
+
+    # Diagonalised systems keep the eigenvalues below 0.0001 that the estimate
+    # keeps, so S(A|B...K) = S(A) as closely as S is estimated
+    rest = mask_labels(m.full & ~1)
+    rest_values = np.clip(spectrum(rest_p), 1e-300, None)
+    assert np.sum(rest_values < 0.0001) > 100
+    assert np.isclose(m.entropy(rest), -np.sum(rest_values * np.log2(rest_values)))
+    assert abs(m.conditional_entropy('A', rest) - S_A) <= 2 * tol
+
+    print("test_slq_quantum_state: --- PASSED in %s seconds ---" % (time.time() - start_time))
+
+
+def test_low_rank_state(gen_func, lim, dim=2):
+    start_time = time.time()
+    for n in [dim**2, dim**3, dim**4]:
+        for i in range(lim):
+            L = gen_func(n)
+            p = L.matrix()
+            # Entropies and separated systems from the factor match those of
+            # the density matrix
+            assert np.allclose(entropy_vector(L, dim), entropy_vector(p, dim))
+            assert np.isclose(vonNeumann(L), vonNeumann(p))
+            assert np.isclose(purity(L), purity(p))
+            m = QuantumState(L, dim)
+            assert np.allclose(m['A'], QuantumState(p, dim)['A'])
+
+    print("%d of each of %d, %d, %d dim states tested" % (lim, dim**2, dim**3, dim**4))
+    print("test_low_rank_state %s: --- PASSED in %s seconds ---" % (gen_func, time.time() - start_time))
+
+
+def test_pure_entropy_vector(lim):
+    start_time = time.time()
+    for dim, q in [(2, 3), (2, 5), (3, 3), (2, 11)]:
+        for i in range(lim):
+            # Normalised gaussian vector, as a Haar unitary of size 2^11 is slow
+            u = np.random.randn(dim**q) + 1j * np.random.randn(dim**q)
+            u = u / LA.norm(u)
+            m = QuantumState(u, dim)
+            vector = entropy_vector(m, dim)
+            # No system of |u> is formed, least of all |u><u|
+            assert m.full not in m.systems
+            assert len(m.systems) == 0
+            # S(X) = S(complement of X) for pure states, and S(ABC..) = 0
+            assert np.allclose(vector[:-1], vector[-2::-1])
+            assert np.isclose(vector[-1], 0)
+            if(q < 6):
+                p = np.outer(u, np.conj(u))
+                assert np.allclose(vector, entropy_vector(p, dim))
+
+    print("%d of each of 3, 5, 11 qubit and 3 qutrit state vectors tested" % (lim))
+    print("test_pure_entropy_vector: --- PASSED in %s seconds ---" % (time.time() - start_time))
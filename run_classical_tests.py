@@ -1,5 +1,8 @@
 import numpy as np
+import pytest
 from shannon import *
+from sample_entropy import SampleEntropy
+from sparse_probs import *
 
 
 n = 10000
@@ -7,73 +10,78 @@ def test_shannon_less_than_log():
     """
     Returns true if H(X) <= log|X|
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert shannon_leq_log(pxy)
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(shannon_leq_log(pxy))
 
 def test_shannon_subadditivity():
     """
     Returns true if H(X,Y) <= H(X) + H(Y)
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert subadditivity(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(subadditivity(pxy))
 
 def test_H_X_less_than_H_XY():
     """
     Returns true if H(X) <= H(XY)
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert H_X_leq_H_XY_s(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(H_X_leq_H_XY_s(pxy))
 
 def test_shannon_mutual_information_less_than_y():
     """
     Returns true if I(X:Y) <= H(Y)
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert mutualInfo_leq_HY(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(mutualInfo_leq_HY(pxy))
 
 def test_shannon_mutual_information_less_than_min():
     """
     Returns true if I(X:Y) <= min(H(X),H(Y))
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert mutualInfo_leqMin(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(mutualInfo_leqMin(pxy))
 
 def test_shannon_mutual_information_less_than_min():
     """
     Returns true if I(X:Y) <= log|X| and log|Y|
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert mutualInfo_leq_log(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(mutualInfo_leq_log(pxy))
 
 def test_shannon_conditional_less_than_y():
     """
     Returns true if H(X|Y) <= H(X)
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert cond_leq_HY(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(cond_leq_HY(pxy))
 
 def test_shannon_greater_than_max():
     """
     Returns true if H(X,Y) >= max[H(x), H(Y)]
     """
-    for i in range(n):
-        pxy = randomProbabilityDist(4)
-        assert HXY_geq_max(pxy) == True
+    pxy = randomProbabilityDists(n, 4)
+    assert np.all(HXY_geq_max(pxy))
 
 def test_shannon_subadditivity():
     """
     Returns true if H(X,Y,Z) + H(Y) <= H(X,Y) + H(Y,Z)
     """
-    for i in range(n):
-        p3 = randomProbabilityDist(8)
-        assert strongSubadditivity(p3) == True
+    p3 = randomProbabilityDists(n, 8)
+    assert np.all(strongSubadditivity(p3))
+
+
+def test_shannon_batch():
+    """
+    Returns true if shannon_batch gives the entropy of each row, with
+    0 log(0) = 0, and raises ValueError for invalid distributions
+    """
+    p = np.array([[0.5, 0.5, 0, 0], [1, 0, 0, 0], [0.25, 0.25, 0.25, 0.25]])
+    assert np.allclose(shannon_batch(p), [1, 0, 2])
+    assert np.allclose(shannon_batch(p.T, axis=0), [1, 0, 2])
+    with pytest.raises(ValueError):
+        shannon_batch([[0.5, 0.6], [0.5, 0.5]])
+    with pytest.raises(ValueError):
+        shannon_batch([1.5, -0.5])
 
 
 ######## NON SHANNON INEQUALITIES
@@ -140,3 +148,147 @@ def test_non_shannon_7():
     for i in range(n):
         p4 = randomProbabilityDist(16)
         assert new_eq7_s(p4) == True
+
+
+######## SEPARATING DISTRIBUTIONS
+def test_separate_probs_marginals():
+    """
+    Returns true if separate_probs gives every marginal and joint distribution
+    of pABCD once, in the order given by separate_order
+    """
+    for i in range(100):
+        p4 = randomProbabilityDist(16)
+        P = p4.reshape(2, 2, 2, 2)
+        lists = separate_probs(p4)
+        for k, labels in enumerate(separate_order(4)):
+            assert len(lists[k]) == len(labels)
+            for p, l in zip(lists[k], labels):
+                axes = tuple(a for a in range(4) if chr(ord('A') + a) not in l)
+                assert np.allclose(p, P.sum(axis=axes).ravel())
+
+
+def test_separate_probs_shape():
+    """
+    Returns true if separate_probs gives every marginal distribution of a
+    distribution of 5 variables with different numbers of outcomes
+    """
+    shape = (2, 3, 4, 2, 3)
+    for i in range(100):
+        p5 = randomProbabilityDist(int(np.prod(shape)))
+        P = p5.reshape(shape)
+        lists = separate_probs(p5, shape)
+        for k, labels in enumerate(separate_order(5)):
+            assert len(lists[k]) == len(labels)
+            for p, l in zip(lists[k], labels):
+                axes = tuple(a for a in range(5) if chr(ord('A') + a) not in l)
+                assert np.allclose(p, P.sum(axis=axes).ravel())
+
+
+def non_shannon_slack_s(pABCD):
+    """
+    Returns RHS - LHS of new_eq1_s ... new_eq7_s of distribution pABCD
+    """
+    s,j,j3 = separate_probs(pABCD)
+    pABC, pABD, pBCD, pACD = j3[0], j3[1], j3[2], j3[3]
+    pAB, pBC, pAC, pBD, pAD, pCD = j[0], j[1], j[2], j[3], j[4], j[5]
+    pA, pB, pC, pD = s[0], s[1], s[2], s[3]
+
+    I_A_B = mutual_information_s(pAB)        # I(A:B)
+    I_C_D = mutual_information_s(pCD)        # I(C:D)
+    I_A_D = mutual_information_s(pAD)        # I(A:D)
+    I_B_D = mutual_information_s(pBD)        # I(B:D)
+    I_ACD = and_mutual_information_s(pACD)   # I(A:C,D)
+
+    I_AB_C = cond_mutual_information_s(pAC, pC, pABC, pBC) # I(A:B|C)
+    I_AC_B = cond_mutual_information_s(pAB, pB, pABC, pBC) # I(A:C|B)
+    I_BC_A = cond_mutual_information_s(pAB, pA, pABC, pAC) # I(B:C|A)
+    I_AB_D = cond_mutual_information_s(pAD, pD, pABD, pBD) # I(A:B|D)
+    I_AC_D = cond_mutual_information_s(pAD, pD, pACD, pCD) # I(A:C|D)
+    I_BC_D = cond_mutual_information_s(pBD, pD, pBCD, pCD) # I(B:C|D)
+    I_AD_B = cond_mutual_information_s(pAB, pB, pABD, pBD) # I(A:D|B)
+    I_AD_C = cond_mutual_information_s(pAC, pC, pACD, pCD) # I(A:D|C)
+    I_BD_A = cond_mutual_information_s(pAB, pA, pABD, pAD) # I(B:D|A)
+    I_CD_A = cond_mutual_information_s(pAC, pA, pACD, pAD) # I(C:D|A)
+    I_CD_B = cond_mutual_information_s(pBC, pB, pBCD, pBD) # I(C:D|B)
+
+    return [I_A_B + I_ACD + 3*I_CD_A + I_CD_B - 2*I_C_D,
+            3*I_AB_C + 3*I_AC_B + 3*I_BC_A + 2*I_A_D + 2*I_BC_D - 2*I_A_B,
+            4*I_AB_C + I_AC_B + 2*I_BC_A + 3*I_AB_D + I_BD_A + 2*I_C_D - 2*I_A_B,
+            3*I_AB_C + 2*I_AC_B + 4*I_BC_A + 2*I_AC_D + I_AD_C + 2*I_B_D + I_CD_A - 2*I_A_B,
+            5*I_AB_C + 3*I_AC_B + I_BC_A + 2*I_A_D + 2*I_BC_D - 2*I_A_B,
+            4*I_AB_C + 4*I_AC_B + I_BC_A + 2*I_A_D + 2*I_BC_D + I_CD_B - 2*I_A_B,
+            3*I_AB_C + 2*I_AC_B + 2*I_BC_A + 2*I_AB_D + I_AD_B + I_BD_A + 2*I_C_D - 2*I_A_B]
+
+
+def test_non_shannon_all_s():
+    """
+    Returns true if the batched non shannon-type inequalities agree with
+    new_eq1_s ... new_eq7_s, both in whether they hold and in their slack,
+    and hold for a batch of distributions
+    """
+    p4 = randomProbabilityDists(1000, 16)
+    holds, slack = non_shannon_all_s(p4)
+    eqs = [new_eq1_s, new_eq2_s, new_eq3_s, new_eq4_s, new_eq5_s, new_eq6_s, new_eq7_s]
+    for i in range(len(p4)):
+        assert list(holds[i]) == [eq(p4[i]) for eq in eqs]
+    assert np.all(holds)
+
+    # slack is RHS - LHS of each inequality as written in new_eq1_s ...
+    # new_eq7_s
+    for i in range(20):
+        assert np.allclose(slack[i], non_shannon_slack_s(p4[i]))
+
+    violations, min_slack = screen_non_shannon_s(n, block=1000)
+    assert np.all(violations == 0)
+
+
+def test_sample_entropy():
+    """
+    Returns true if entropies estimated from batches of samples are those of
+    the observed frequencies, with the Miller-Madow correction added
+    """
+    shape = (2, 3, 2)
+    s = SampleEntropy(shape)
+    for i in range(10):
+        samples = [np.random.randint(0, d, size=1000) for d in shape]
+        s.update(np.stack(samples, axis=1))
+    p = s.probs('ABC')
+    assert np.allclose(s.entropy_vector(), entropy_vector_s(p, shape))
+    assert np.isclose(s.mutual_information('A', 'C'), mutual_information_s(separate_probs(p, shape)[1][2]))
+    K = np.count_nonzero(s.counts('AB'))
+    assert np.isclose(s.entropy('AB', 'miller_madow'), s.entropy('AB') + (K - 1) / (2. * s.n * np.log(2)))
+    with pytest.raises(ValueError):
+        s.update([[0, 3, 0]])
+
+
+def test_sparse_probs():
+    """
+    Returns true if a sparse distribution has the same marginals, entropies
+    and non shannon-type inequality slack as the dense distribution
+    """
+    shape = (3, 4, 2, 5)
+    for i in range(100):
+        p4 = randomProbabilityDist(120)
+        p4[np.random.random(120) < 0.7] = 0
+        p4 = p4 / np.sum(p4)
+        s = sparse_probs(p4, shape)
+        assert np.allclose(s.dense('BD'), marginal(p4, shape, 'BD'))
+        assert np.allclose(s.entropy_vector(), entropy_vector_s(p4, shape))
+        holds, slack = non_shannon_all_sparse(s)
+        assert np.all(holds)
+
+
+
+def test_probs_shape():
+    """
+    Returns true if the shape of a distribution is found from its length by
+    exact integer roots, so 4th powers and cubes are never taken as squares
+    """
+    assert probs_shape(64) == (4, 4, 4)
+    assert probs_shape(256) == (4, 4, 4, 4)
+    assert probs_shape(1000) == (10, 10, 10)
+    for n in [125, 216, 343, 512]:
+        p3 = randomProbabilityDist(n)
+        s, j, j3 = separate_probs(p3)
+        assert len(s) == 3 and len(j) == 3
+        assert np.allclose(j[0], p3.reshape(probs_shape(n)).sum(axis=2).ravel())
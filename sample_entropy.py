@@ -0,0 +1,113 @@
+import numpy as np
+import math
+import sys
+from utils import *
+from separate_probs import ProbMarginals
+
+# Estimates entropies of random variables from a stream of samples, without
+# building the probability distribution first.
+# Random variables are labelled as in separate_probs.py: variable i is
+# labelled chr(ord('A') + i) e.g. I(A:C|B), and the counts of each joint
+# distribution are flat, in the same order as the distributions of
+# separate_probs(p, shape)
+
+
+class SampleEntropy(object):
+    """
+    Online estimator of the entropies of q random variables with the given
+    shape (number of outcomes of each variable), from batches of samples e.g.
+        s = SampleEntropy((2, 3, 2))
+        s.update(samples)        # samples: (m, 3) array of outcomes
+        s.mutual_information('A', 'B', 'C')
+    Only the joint counts are updated per sample, at a cost that does not
+    depend on shape. Counts of the joint distributions of smaller sets of
+    variables are summed from them when asked for (see ProbMarginals) and
+    kept until the next update
+    The joint counts are a dense table, so memory is O(prod(shape)). For
+    many variables with many outcomes each, see SparseProbs in
+    sparse_probs.py
+    method = 'plugin' gives the entropy of the observed frequencies and
+    method = 'miller_madow' adds the Miller-Madow bias correction
+    (K - 1) / (2N ln 2), where K is the number of outcomes seen in N samples
+    """
+
+    def __init__(self, shape):
+        self.shape = tuple(int(n) for n in shape)
+        self.q = len(self.shape)
+        self.full = (1 << self.q) - 1
+        self.size = int(np.prod(self.shape))
+        self.joint = np.zeros(self.size, dtype=np.int64)
+        self.n = 0
+        self.marginals = None
+
+    def update(self, samples):
+        """
+        Adds samples, an (m, q) array with one sample of the q variables per
+        row (or a single sample of length q), to the counts
+        Raises ValueError if a sample is outside shape
+        """
+        samples = np.asarray(samples, dtype=np.int64).reshape(-1, self.q)
+        if(np.any(samples < 0) or np.any(samples >= np.array(self.shape))):
+            raise ValueError("Samples are not outcomes of a " + str(self.shape) + " distribution")
+
+        flat = np.ravel_multi_index(samples.T, self.shape)
+        np.add.at(self.joint, flat, 1)
+        self.n += len(samples)
+        self.marginals = None
+
+    def counts(self, labels):
+        """
+        Returns the counts of the joint outcomes of the variables labels
+        """
+        if(self.marginals is None):
+            self.marginals = ProbMarginals(self.joint, self.shape)
+        return self.marginals.get(labels)
+
+    def probs(self, labels):
+        """
+        Returns the observed frequencies of the joint outcomes of labels
+        """
+        return self.counts(labels) / self.n
+
+    def entropy(self, labels, method='plugin'):
+        """
+        Returns estimate of H(labels) e.g. s.entropy('AB')
+        The entropy of no variables (labels = '') or of no samples is 0
+        """
+        if(not system_mask(labels) or self.n == 0):
+            return 0.0
+
+        # -sum(c/N log(c/N)) over the non-zero counts c
+        counts = self.counts(labels)
+        counts = counts[counts > 0]
+        H = np.log2(self.n) - np.sum(counts * np.log2(counts)) / self.n
+        if(method == 'miller_madow'):
+            H += (len(counts) - 1) / (2. * self.n * np.log(2))
+        elif(method != 'plugin'):
+            raise ValueError("Unknown entropy estimator " + str(method))
+        return H
+
+    def conditional_entropy(self, A, B, method='plugin'):
+        """
+        Returns estimate of H(A|B) = H(A,B) - H(B)
+        """
+        return self.entropy(A + B, method) - self.entropy(B, method)
+
+    def mutual_information(self, A, B, C='', method='plugin'):
+        """
+        Returns estimate of I(A:B|C) = H(A,C) + H(B,C) - H(C) - H(A,B,C),
+        which is I(A:B) if C is not given
+        """
+        H_AC = self.entropy(A + C, method)
+        H_BC = self.entropy(B + C, method)
+        H_C = self.entropy(C, method)
+        H_ABC = self.entropy(A + B + C, method)
+        return H_AC + H_BC - H_C - H_ABC
+
+    def entropy_vector(self, method='plugin'):
+        """
+        Returns estimates of the entropies of all 2^q - 1 joint distributions
+        in bitmask order (see entropy_vector_s in shannon.py)
+        """
+        return np.array([self.entropy(mask_positions(mask), method)
+                         for mask in range(1, self.full + 1)])
@@ -16,6 +16,14 @@ import sys
 # Order for pABCD: pABC (0), pABD (1), pBCD (2), pACD (3)
 # joint_systems3 = []
 
+# Distributions are identified by the labels of their random variables
+# (e.g. 'AC'), so each distribution is stored and separated only once.
+# separate_index(q, labels) in utils.py gives the position of a distribution
+# in its list
+
+# Distributions of any number of variables, with any number of outcomes each,
+# are separated by giving their shape e.g. separate_probs(p, (2, 3, 2)) (see
+# class ProbMarginals)
 
 
 def remove_dups_list(List):
@@ -26,184 +34,99 @@ def remove_dups_list(List):
     return seen
 
 
-def separate_probs(p):
-    s, j, j3 = separate_main(p, [], [], [])
-    return s, j, j3
+def separate_probs(p, shape=None):
+    """
+    Separate joint probability distribution p into marginal and smaller
+    joint distributions
+    shape: number of outcomes of each random variable e.g. (2, 4, 3) for
+    any number of variables. If not given, p is taken as 2, 3 or 4 variables
+    with the same number of outcomes from its length (see separate_main)
+    Returns a list where element k lists the (k+1)-variable distributions in
+    the order given by separate_order, with at least 3 lists
+    """
+    if(shape is None):
+        s, j, j3 = separate_main(p, [], [], [])
+        return s, j, j3
+
+    levels = marginal_levels(ProbMarginals(p, shape))
+    return levels + [[] for k in range(len(levels), 3)]
 
 
 def separate_main(p, systems, joint_systems, joint_systems3):
     """
     Separate joint probability distribution p into marginal and smaller
-    joint probabilities
+    joint probabilities, appended to systems, joint_systems, joint_systems3
+    The number of variables is 4, 3 or 2 if len(p) is a 4th power, cube or
+    square (so a 16-entry distribution is 4 binary variables). Give the shape
+    to separate_probs for any other distribution
+    p can be a stack of distributions of shape (batch, n)
     """
 
-    q = len(p) ** (1. / 4)
-    c = len(p) ** (1. / 3)
-    s = len(p) ** (1. / 2)
-
-    if(q.is_integer() and (q != 1)):
-        __separate_4(p, systems, joint_systems, joint_systems3)
-    elif(c.is_integer() and (c != 1)):
-        __separate_3(p, systems, joint_systems, joint_systems3)
-    elif(s.is_integer() and (s != 1)):
-        __separate_2(p, systems, joint_systems, joint_systems3)
-    else:
-        print("Error in Function 'separate_probs' in separate_probs.py':")
-        print("Probability list length is not a square, cube or to the 4th power")
-        sys.exit()
-
-    # systems = remove_dups_list(systems)
-    # joint_systems = remove_dups_list(joint_systems)
-    # joint_systems3 = remove_dups_list(joint_systems3)
+    shape = probs_shape(np.shape(p)[-1])
+    levels = marginal_levels(ProbMarginals(p, shape))
+    for store, level in zip([systems, joint_systems, joint_systems3], levels):
+        store.extend(level)
+
     return systems, joint_systems, joint_systems3
 
 
-def __separate_2(pAB, systems, joint_systems, joint_systems3):
+def probs_shape(n):
     """
-    Separate list pAB to pA and pB
+    Returns the shape of a distribution of length n as separate_main takes
+    it: 4, 3 or 2 variables with the same number of outcomes if n is a 4th
+    power, cube or square e.g. probs_shape(16) = (2, 2, 2, 2)
     """
-    # length of pA, pB square root of the length pAB
-    n = len(pAB) ** (1. / 2)
-    if(not n.is_integer()):
-        print("Error in Function 'separate_2' in separate_probs.py':")
-        print("Probability list length is not a square")
-        sys.exit()
-
-    n = int(n)
-    pA = np.zeros(n)
-    pB = np.zeros(n)
-
-    k = 0
-    for i in range(n):
-        indices = range(i, i+n*n, n)
-        pB[i] = pAB[indices].sum()
-
-        if((k % n) == 1):
-            k += (n-1)
-        indices = range(k, k+n)
-        pA[i] = pAB[indices].sum()
-        k += 1
-
-        # Store in list
-        if(not listInList(pA, systems)):
-            systems.append(pA)
-        if(not listInList(pB, systems)):
-            systems.append(pB)
-
-
-def __separate_3(pABC, systems, joint_systems, joint_systems3):
+    for q in [4, 3, 2]:
+        k = integer_root(n, q)
+        if(k is not None and k != 1):
+            return (k,) * q
+
+    print("Error in Function 'separate_probs' in separate_probs.py':")
+    print("Probability list length is not a square, cube or to the 4th power")
+    sys.exit()
+
+
+def marginal(p, shape, labels):
     """
-    Separate list pABC to get pAB, pBC and pAC
+    Returns the marginal distribution of the random variables labels (e.g.
+    'AC') of joint distribution p of variables with the given shape
+    e.g. marginal(pABC, (2, 3, 2), 'AC')
     """
+    return ProbMarginals(p, shape).get(labels)
+
 
-    # length of pAB is a cube
-    # length of pAB, pBC, pAC is the square of the cube root of pABC
-    n = len(pABC) ** (1. / 3)
-    if(not n.is_integer()):
-        print("Error in Function 'separate_3' in separate_probs.py':")
-        print("Probability list length is not a cube")
-        sys.exit()
-
-    lp = int(n ** 2)
-    pAB = np.zeros(lp)
-    pAC = np.zeros(lp)
-    pBC = np.zeros(lp)
-
-    n = int(n)
-
-    j = 0
-    k = 0
-    for i in range(lp):
-        indices = range(i, i+n*lp, lp)
-        pBC[i] = pABC[indices].sum() # pABC[i] + pABC[i + lp] + pABC[i + 2*lp]
-
-        if((j%lp) == n): # j == (n%lp)
-            j += (lp-n)
-        indices = range(j, j+n*n, n)
-        pAC[i] = pABC[indices].sum() # pABC[j] + pABC[j + n] + pABC[j + 2*n]
-        j += 1
-
-        if((k % n) == 1):#k == (1%n)):
-            k += (n-1)
-        indices = range(k, k+n)
-        pAB[i] = pABC[indices].sum() #pABC[k] + pABC[k + 1] + pABC[k + 2]
-        k += 1
-
-    # Storing intermediiate joint systems
-    if(not listInList(pAB, joint_systems)):
-        joint_systems.append(pAB)
-    if(not listInList(pBC, joint_systems)):
-        joint_systems.append(pBC)
-    if(not listInList(pAC, joint_systems)):
-        joint_systems.append(pAC)
-
-    # Recursively separate further
-    separate_main(pAB, systems, joint_systems, joint_systems3)
-    separate_main(pBC, systems, joint_systems, joint_systems3)
-    separate_main(pAC, systems, joint_systems, joint_systems3)
-
-
-def __separate_4(pABCD, systems, joint_systems, joint_systems3):
+class ProbMarginals(SystemLattice):
     """
-    Separate list pABCD to get pABC, pBCD, pACD and pABD
+    Computes marginal distributions of joint probability distribution p on
+    demand, by reshaping p into a tensor with one axis per random variable
+    and summing over the axes of the variables left out. e.g.
+        m = ProbMarginals(pABC, (2, 3, 2))
+        pA, pAC = m['A'], m['AC']
+    Distributions are stored by bitmask (see system_mask). Each is computed
+    once and summed from the smallest distribution already computed that
+    contains it (see SystemLattice in utils.py). Marginals are flat, in the
+    same order as p
+    p can be a stack of distributions of shape (batch, n)
     """
 
-    # length of pABC is a to the poDer of 4
-    # length ofpABC, pBCD, pACD and pABD is the cube of the 4th  root of pABCD
-    n = len(pABCD) ** (1. / 4)
-    if(not n.is_integer()):
-        print("Error in Function 'separate_4' in separate_probs.py':")
-        print("Probability list length is not written to the 4th power")
-        sys.exit()
-
-    lp = int(n ** 3)
-    ln = int(n ** 2)
-
-    pABC = np.zeros(lp)
-    pABD = np.zeros(lp)
-    pBCD = np.zeros(lp)
-    pACD = np.zeros(lp)
-
-    n = int(n)
-
-    j = 0
-    k = 0
-    m = 0
-    for i in range(lp):
-        indices = range(i, i+n*lp, lp)
-        pBCD[i] = pABCD[indices].sum()
-
-        if((j % lp) == ln):
-            j += (lp-ln)
-        indices = range(j, j+n*ln, ln)
-        pACD[i] = pABCD[indices].sum()
-        j += 1
-
-        if((m % ln) == n):
-            m += (ln-n)
-        indices = range(m, m+n*n, n)
-        pABD[i] = pABCD[indices].sum()
-        m += 1
-
-        if((k % n) == 1):
-            k += (n-1)
-        indices = range(k, k+n)
-        pABC[i] = pABCD[indices].sum()
-        k += 1
-
-
-    # Storing intermediiate joint systems
-    if(not listInList(pABC, joint_systems3)):
-        joint_systems3.append(pABC)
-    if(not listInList(pABD, joint_systems3)):
-        joint_systems3.append(pABD)
-    if(not listInList(pBCD, joint_systems3)):
-        joint_systems3.append(pBCD)
-    if(not listInList(pACD, joint_systems3)):
-        joint_systems3.append(pACD)
-
-    # Recursively separate further
-    separate_main(pABC, systems, joint_systems, joint_systems3)
-    separate_main(pABD, systems, joint_systems, joint_systems3)
-    separate_main(pBCD, systems, joint_systems, joint_systems3)
-    separate_main(pACD, systems, joint_systems, joint_systems3)
+    func_str = "get_mask in separate_probs.py"
+
+    def __init__(self, p, shape):
+        p = np.asarray(p)
+        shape = tuple(int(n) for n in shape)
+        if(int(np.prod(shape)) != p.shape[-1]):
+            print("Error in Function 'ProbMarginals in separate_probs.py':")
+            print("Probability list length is not the product of " + str(shape))
+            sys.exit()
+        SystemLattice.__init__(self, shape)
+
+        self.p = p
+        self.shape = shape
+        self.batch = p.shape[:-1]
+        self.systems[self.full] = p
+
+    def trace(self, parent, positions, traced):
+        b = len(self.batch)
+        t = parent.reshape(self.batch + tuple(self.shape[s] for s in positions))
+        sub_p = t.sum(axis=tuple(b + i for i in traced))
+        return sub_p.reshape(self.batch + (-1,))
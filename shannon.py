@@ -8,24 +8,38 @@ from separate_probs import *
 def shannon(probs):
     """
     Returns Shannon entropy H(x) = -sum(P(x)log(P(x)))
+    probs can also be a 2D array with one distribution per row, in which
+    case an array of their entropies is returned (see shannon_batch)
     """
-    # Check that probabilities given add up to one and are > 0 and < 1
-    checkSum = np.sum(probs)
-
-    if(np.any(probs > 1) or np.any(probs < 0)) : # probabilities are between 0 and 1
+    try:
+        return shannon_batch(probs)
+    except ValueError as e:
         print("Error in Function 'shannon in shannon.py':")
-        print("Error: Probabilities are not > 1 or < 0")
+        print("Error: " + str(e))
         sys.exit()
 
-    if(not isclose(checkSum,1)) :
-        print("Error in Function 'shannon in shannon.py':")
-        print("Error: Probabilities do not add to one")
-        sys.exit()
 
-    # If probabilities are valid,
+def shannon_batch(probs, axis=-1):
+    """
+    Returns Shannon entropies H(x) = -sum(P(x)log(P(x))) of the distributions
+    along axis of probs e.g. one distribution per row of a 2D array, taking
+    0 log(0) = 0
+    Raises ValueError if any probability is not between 0 and 1, or any
+    distribution does not add to one
+    """
+    probs = np.asarray(probs, dtype=float)
+
+    # Check that probabilities given add up to one and are > 0 and < 1
+    if(np.any(probs > 1) or np.any(probs < 0)):
+        raise ValueError("Probabilities are not > 1 or < 0")
+
+    checkSum = np.sum(probs, axis=axis)
+    if(not np.all(np.abs(checkSum - 1) <= 1e-14 * np.maximum(checkSum, 1))):
+        raise ValueError("Probabilities do not add to one")
+
     # 2 represents bits
-    v = probs*np.log2(probs)
-    return -np.sum(v)
+    v = probs * np.log2(np.where(probs > 0, probs, 1))
+    return -np.sum(v, axis=axis)
 
 def binary_entropy(p):
     """
@@ -43,6 +57,16 @@ def randomProbabilityDist(n):
     return probs
 
 
+def randomProbabilityDists(lim, n):
+    """
+    Generate lim random probability distributions of n numbers as the rows
+    of a lim x n array (see randomProbabilityDist)
+    """
+    probs = np.random.random((lim, n))
+    probs /= probs.sum(axis=1, keepdims=True)
+    return probs
+
+
 def subadditivity(Pxy):
     """
     Returns true if H(X,Y) <= H(X) + H(Y)
@@ -61,7 +85,7 @@ def shannon_leq_log(px):
     Returns true if H(X) <= log|X|
     """
     H_X = shannon(px)
-    l = np.log2(len(px))
+    l = np.log2(np.shape(px)[-1])
 
     return H_X <= l
 
@@ -140,10 +164,10 @@ def mutualInfo_leq_log(Pxy):
     px, py = s[0], s[1]
 
     # the dim of px and py
-    upper_x = np.log2(len(px))
-    upper_y = np.log2(len(py))
+    upper_x = np.log2(np.shape(px)[-1])
+    upper_y = np.log2(np.shape(py)[-1])
 
-    return (I_XY <= upper_x) and (I_XY <= upper_y)
+    return (I_XY <= upper_x) & (I_XY <= upper_y)
 
 
 def cond_leq_HY(Pxy):
@@ -169,7 +193,7 @@ def HXY_geq_max(Pxy) :
     H_Y = shannon(py)
     H_XY = shannon(Pxy)
 
-    return H_XY >= max(H_X, H_Y)
+    return H_XY >= np.maximum(H_X, H_Y)
 
 
 def strongSubadditivity(Pxyz):
@@ -223,6 +247,22 @@ def and_mutual_information_s(pABC):
     return H_A + H_BC - H_ABC
 
 
+def entropy_vector_s(p, shape=None):
+    """
+    Returns the entropies of all 2^q - 1 joint distributions of the q random
+    variables of p in bitmask order: H(A), H(B), H(A,B), H(C), H(A,C), ...
+    (labels from vector_labels(q) in utils.py)
+    shape as in separate_probs. p can be a stack of distributions of shape
+    (batch, n), in which case the result has shape (batch, 2^q - 1)
+    """
+    if(shape is None):
+        shape = probs_shape(np.shape(p)[-1])
+
+    m = ProbMarginals(p, shape)
+    marginal_levels(m)
+    return np.stack([shannon_batch(m.get_mask(mask)) for mask in range(1, m.full + 1)], axis=-1)
+
+
 def print_seps(p):
     """
     Prints all elements of separate_probs
@@ -512,3 +552,41 @@ def non_shannon_eqs(pABCD, eq_no):
         return result
 
     return res
+
+
+def non_shannon_all_s(pABCD):
+    """
+    Returns (holds, slack) for all 7 non shannon-type inequalities of
+    new_eq1_s ... new_eq7_s, from one entropy vector of pABCD
+    slack is RHS - LHS of each inequality (see non_shannon_terms in
+    utils.py), so holds = slack >= 0
+    pABCD can be a stack of distributions of shape (batch, n), in which case
+    holds and slack have shape (batch, 7)
+    """
+
+    # Ensure that length of pABCD is to the 4th power
+    check_power(np.shape(pABCD)[-1], 4, "non_shannon_all_s in shannon.py")
+
+    slack = inequality_slack(entropy_vector_s(pABCD), non_shannon_matrix())
+
+    return slack >= 0, slack
+
+
+def screen_non_shannon_s(lim, n=16, block=10**5):
+    """
+    Checks the 7 non shannon-type inequalities (see non_shannon_all_s) on lim
+    random distributions of length n, block distributions at a time
+    Returns the number of distributions violating each inequality and the
+    smallest slack of each inequality
+    """
+    violations = np.zeros(len(non_shannon_terms), dtype=int)
+    min_slack = np.full(len(non_shannon_terms), np.inf)
+    done = 0
+    while(done < lim):
+        size = min(block, lim - done)
+        holds, slack = non_shannon_all_s(randomProbabilityDists(size, n))
+        violations += np.sum(~holds, axis=0)
+        min_slack = np.minimum(min_slack, np.min(slack, axis=0))
+        done += size
+
+    return violations, min_slack
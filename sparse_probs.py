@@ -0,0 +1,158 @@
+import numpy as np
+import math
+import sys
+from utils import *
+
+# Joint probability distributions kept as their non-zero probabilities only,
+# so memory is proportional to the number of outcomes with non-zero
+# probability rather than the product of the number of outcomes of each
+# random variable.
+# Random variables are labelled as in separate_probs.py: variable i is
+# labelled chr(ord('A') + i), and marginal distributions are stored by
+# bitmask (see system_mask)
+
+
+class SparseProbs(SystemLattice):
+    """
+    Joint probability distribution of q random variables given by coords,
+    an (m, q) array with one outcome of the q variables per row, and probs,
+    the probabilities of these outcomes (outcomes not given have probability
+    0). Repeated outcomes are added together. e.g.
+        p = SparseProbs([[0, 5, 63], [2, 1, 0]], [0.25, 0.75])
+        p.entropy('AC'), p.mutual_information('A', 'B', 'C')
+    Marginal distributions (coords, probs) are computed on demand by adding
+    the probabilities of outcomes that agree on the kept variables, and
+    stored. Each is computed once from the one already computed with the
+    fewest non-zero probabilities that contains it (see SystemLattice in
+    utils.py)
+    shape (number of outcomes of each variable) is only needed for dense
+    """
+
+    func_str = "get_mask in sparse_probs.py"
+
+    def __init__(self, coords, probs, shape=None):
+        coords = np.asarray(coords, dtype=np.int64)
+        probs = np.asarray(probs, dtype=float)
+        if(coords.ndim != 2 or len(coords) != len(probs)):
+            print("Error in Function 'SparseProbs in sparse_probs.py':")
+            print("coords should have one row of outcomes per probability")
+            sys.exit()
+        if(np.any(probs < 0) or not np.isclose(np.sum(probs), 1)):
+            print("Error in Function 'SparseProbs in sparse_probs.py':")
+            print("Error: Probabilities are not >= 0 or do not add to one")
+            sys.exit()
+
+        if(shape is None):
+            shape = np.max(coords, axis=0) + 1
+        SystemLattice.__init__(self, [int(n) for n in shape])
+        self.shape = tuple(self.dims)
+        self.systems[self.full] = add_repeated(coords[probs > 0], probs[probs > 0])
+
+    def parent_cost(self, mask):
+        """
+        Number of non-zero probabilities of stored distribution mask
+        """
+        return len(self.systems[mask][1])
+
+    def trace(self, parent, positions, traced):
+        coords, probs = parent
+        keep = [i for i in range(len(positions)) if i not in traced]
+        return add_repeated(coords[:, keep], probs)
+
+    def support_size(self, labels):
+        """
+        Returns the number of outcomes of labels with non-zero probability
+        """
+        return len(self.get(labels)[1])
+
+    def dense(self, labels=None):
+        """
+        Returns the marginal distribution of labels (all variables if not
+        given) as a flat dense vector, in the order of separate_probs
+        """
+        mask = self.full if labels is None else system_mask(labels)
+        coords, probs = self.get_mask(mask)
+        sub_shape = tuple(self.shape[i] for i in mask_positions(mask))
+        p = np.zeros(int(np.prod(sub_shape)))
+        p[np.ravel_multi_index(coords.T, sub_shape)] = probs
+        return p
+
+    def entropy(self, labels):
+        """
+        Returns Shannon entropy H(labels) e.g. p.entropy('AB'), from the
+        non-zero probabilities only. The entropy of no variables is 0
+        """
+        if(not system_mask(labels)):
+            return 0.0
+        _, probs = self.get(labels)
+        return -np.sum(probs * np.log2(probs))
+
+    def conditional_entropy(self, A, B):
+        """
+        Returns H(A|B) = H(A,B) - H(B)
+        """
+        return self.entropy(A + B) - self.entropy(B)
+
+    def mutual_information(self, A, B, C=''):
+        """
+        Returns I(A:B|C) = H(A,C) + H(B,C) - H(C) - H(A,B,C), which is I(A:B)
+        if C is not given
+        """
+        H_AC = self.entropy(A + C)
+        H_BC = self.entropy(B + C)
+        H_C = self.entropy(C)
+        H_ABC = self.entropy(A + B + C)
+        return H_AC + H_BC - H_C - H_ABC
+
+    def entropy_vector(self):
+        """
+        Returns the entropies of all 2^q - 1 joint distributions in bitmask
+        order (see entropy_vector_s in shannon.py)
+        """
+        return np.array([self.entropy(mask_positions(mask))
+                         for mask in range(1, self.full + 1)])
+
+
+def add_repeated(coords, probs):
+    """
+    Returns (coords, probs) with the probabilities of repeated rows of coords
+    added together, so each outcome appears once
+    """
+    coords, inverse = np.unique(coords, axis=0, return_inverse=True)
+    probs = np.bincount(inverse.ravel(), weights=probs, minlength=len(coords))
+    return coords, probs
+
+
+def sparse_probs(p, shape):
+    """
+    Returns SparseProbs of the non-zero probabilities of flat dense
+    distribution p of random variables with the given shape
+    """
+    p = np.asarray(p)
+    flat = np.nonzero(p)[0]
+    coords = np.stack(np.unravel_index(flat, shape), axis=1)
+    return SparseProbs(coords, p[flat], shape)
+
+
+def sparse_from_samples(samples, shape=None):
+    """
+    Returns SparseProbs of the observed frequencies of samples, an (m, q)
+    array with one sample of the q random variables per row
+    """
+    samples = np.asarray(samples, dtype=np.int64)
+    coords, counts = add_repeated(samples, np.ones(len(samples)))
+    return SparseProbs(coords, counts / len(samples), shape)
+
+
+def non_shannon_all_sparse(pABCD):
+    """
+    Returns (holds, slack) for all 7 non shannon-type inequalities (see
+    non_shannon_all_s in shannon.py) of sparse 4-variable distribution pABCD
+    """
+    if(pABCD.q != 4):
+        print("Error in Function 'non_shannon_all_sparse in sparse_probs.py':")
+        print("Distribution is not of 4 random variables")
+        sys.exit()
+
+    slack = inequality_slack(pABCD.entropy_vector(), non_shannon_matrix())
+    return slack >= 0, slack
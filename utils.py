@@ -14,11 +14,11 @@ def is_close_to_zero(n):
 
 def isclose(a, b, rel_tol=1e-14, abs_tol=0.0):
     """
-    Compares floating point numbers
+    Compares floating point numbers, or each pair of numbers in arrays a and b
     """
-    close = abs(a-b) <= max(rel_tol * max(abs(a), abs(b)), abs_tol)
-    close_to_zero = is_close_to_zero(a) and is_close_to_zero(b)
-    return close or close_to_zero
+    close = np.abs(a-b) <= np.maximum(rel_tol * np.maximum(np.abs(a), np.abs(b)), abs_tol)
+    close_to_zero = is_close_to_zero(a) & is_close_to_zero(b)
+    return close | close_to_zero
 
 def allclose(A, B):
     """
@@ -50,12 +50,14 @@ def isMatrixSame(A, B):
     if(dimA != dimB):
         return False
 
-    for i in range(dimA[0]):
-        for j in range(dimA[0]):
-            c = isclose(A[i,j],B[i,j])
-            if(not c):
-                return False
-    return True
+    # Same comparison as isclose, for all entries at once
+    A = np.asarray(A)
+    B = np.asarray(B)
+    abs_A = np.abs(A)
+    abs_B = np.abs(B)
+    close = np.abs(A - B) <= 1e-14 * np.maximum(abs_A, abs_B)
+    close_to_zero = (abs_A <= 0.0001) & (abs_B <= 0.0001)
+    return bool(np.all(close | close_to_zero))
 
 
 def matrixInList(A, L):
@@ -82,10 +84,7 @@ def isListSame(A, B):
     if(dimA != dimB):
         return False
 
-    for i in range(dimA):
-        if(not np.isclose(A[i],B[i])):
-            return False
-    return True
+    return bool(np.all(np.isclose(A, B)))
 
 
 def listInList(ls, searchList):
@@ -170,22 +169,67 @@ def isPowerof3(n):
 def check_n_q(p, dim, n, func_str):
     """
     Ensures quantum system p is a n qubit/qutrit quantum state
+    dim can also be a tuple of the dimension of each subsystem e.g. (2, 3)
     """
-    d = p.shape[0]
-    if(d != dim**n):
+    d = p.shape[-1]
+    if(is_dims_tuple(dim)):
+        valid = (len(dim) == n) and (d == int(np.prod(dim)))
+    else:
+        valid = (d == dim**n)
+
+    if(not valid):
         print("Error in Function '" + func_str + "':")
         print("Quantum system is not a " + str(n) + "-(" + str(dim) + "-dimensional)" + " quantum system")
         sys.exit()
 
 
+def is_dims_tuple(dim):
+    """
+    Returns true if dim lists the dimension of each subsystem e.g. (2, 3)
+    rather than giving one dimension for all subsystems e.g. 2
+    """
+    return isinstance(dim, (tuple, list, np.ndarray))
+
+
+def local_dims(n, dim, func_str):
+    """
+    n = side of matrix, dim = dimension of each subsystem (e.g. 2) or tuple
+    of the dimension of each subsystem (e.g. (2, 2, 3))
+    Returns list of the dimension of each subsystem e.g. [2, 2, 3]
+    If n is not the product of these dimensions, exit with error
+    """
+    if(not is_dims_tuple(dim)):
+        q = check_power_of_dim(n, dim, func_str)
+        return [dim] * q
+
+    dims = [int(d) for d in dim]
+    if(int(np.prod(dims)) != n):
+        print("Error in Function '" + func_str +"':")
+        print("Density matrix given is not a " + str(tuple(dims)) + " state")
+        print("i.e. Width and Length of matrix is not the product of the dimensions")
+        sys.exit()
+    return dims
+
+
+def integer_root(n, e):
+    """
+    Returns integer k with k^e = n, or None if n is not an e'th power
+    Checked exactly, as e.g. 64 ** (1. / 3) = 3.9999999999999996
+    """
+    k = int(round(n ** (1. / e)))
+    for r in (k - 1, k, k + 1):
+        if(r > 0 and r ** e == n):
+            return r
+    return None
+
+
 def check_power(n, pow, func_str):
     """
     Checks if n is written to the pow'th power e.g if pow = 2, then checks if n
     is a square
     """
 
-    p = n ** (1. / pow)
-    if(not p.is_integer()):
+    if(integer_root(n, pow) is None):
         print("Error in Function '" + func_str +"':")
         print("n is not to the specified power")
         sys.exit()
@@ -199,14 +243,14 @@ def check_power_of_dim(n,dim,func_str):
     If not, exit with error
     """
 
-    m = math.log(n)
-    k = math.log(dim)
-    q = m / k
-
-    five_part_state = isclose(q,5)
+    # Exact integer check, so that large q is not lost to rounding
+    q = 0
+    m = 1
+    while(m < n and dim > 1):
+        m *= dim
+        q += 1
 
-    # Checks that q is an integer
-    if(q.is_integer() or five_part_state):
+    if(m == n):
         return q
     else:
         print("Error in Function '" + func_str +"':")
@@ -216,10 +260,10 @@ def check_power_of_dim(n,dim,func_str):
 
 def check_square_matrix(p,func_str):
     """
-    Checks that the matrix p is square
+    Checks that the matrix p (or each matrix in a stack p) is square
     """
-    p1 = p.shape[0]
-    p2 = p.shape[1]
+    p1 = p.shape[-2]
+    p2 = p.shape[-1]
 
     if(p1 != p2):
         print("Error in Function '" + func_str +"':")
@@ -229,19 +273,15 @@ def check_square_matrix(p,func_str):
 
 def check_same_size(p,r,func_str):
     """
-    Checks that matrix p and r are both square and the same size
-    If it's not, exit with error
+    Checks that matrix p and r (or stacks of matrices) are both square and the
+    same size. If it's not, exit with error
     """
-    p1 = p.shape[0]
-    p2 = p.shape[1]
-    r1 = r.shape[0]
-    r2 = r.shape[1]
-
     # Check that p and r are square
     check_square_matrix(p,func_str)
     check_square_matrix(r,func_str)
 
-    if((p1 != r1) or (p2 != r2)):
+    # Stacks of matrices must also have the same number of matrices
+    if(p.shape != r.shape):
         print("Error in Function '" + func_str +"':")
         print("Density matrices size are not equal")
         sys.exit()
@@ -269,3 +309,310 @@ def check_true(f, *args):
         if not f(*func_args) :
             return False
     return True
+
+
+# Labelling of subsystems (quantum) and random variables (classical) shared
+# by partial_trace.py and separate_probs.py. Subsystem i is labelled by the
+# letter chr(ord('A') + i) and by bit i of a bitmask e.g. AC = 0b101
+
+def trace_order(q):
+    """
+    Returns the order in which single subsystems are traced out of a q-partite
+    system so that the separated systems are stored in the order described at
+    the top of partial_trace.py and separate_probs.py
+    e.g for pABC, trace out C, A then B to get pAB, pBC, pAC
+    """
+    if(q == 2):
+        return [1, 0]
+    return list(range(q-1, 1, -1)) + [0, 1]
+
+
+# Orders computed by separate_order, stored by q
+separate_orders = {}
+
+def separate_order(q):
+    """
+    Returns the labels of the separated systems of a q-partite system in the
+    order separate (and separate_probs) stores them. Element k lists the (k+1)-partite systems e.g.
+    separate_order(3) = [['A', 'B', 'C'], ['AB', 'BC', 'AC']]
+    """
+    if(q in separate_orders):
+        return separate_orders[q]
+
+    order = [[] for k in range(q - 1)]
+    seen = set()
+    # Systems whose separation has finished, so all of their smaller systems
+    # are already in seen and separating them again stores nothing new
+    done = set()
+
+    # Separate systems in the same order as the original recursive method:
+    # every (k-1)-partite system of a k-partite system is stored, then each
+    # is separated in turn
+    def separate_labels(labels):
+        k = len(labels)
+        if(k < 2 or labels in done):
+            return
+        subs = [labels[:i] + labels[i+1:] for i in trace_order(k)]
+        for sub in subs:
+            if(sub not in seen):
+                seen.add(sub)
+                order[k-2].append(sub)
+        if(k > 2):
+            for sub in subs:
+                separate_labels(sub)
+        done.add(labels)
+
+    separate_labels(mask_labels((1 << q) - 1))
+    separate_orders[q] = order
+    return order
+
+
+def separate_index(q, labels):
+    """
+    Returns the position of system labels in its list returned by separate
+    e.g. separate_index(4, 'BD') = 3 i.e. pBD = joint_systems[3]
+    """
+    labels = mask_labels(system_mask(labels))
+    return separate_order(q)[len(labels) - 1].index(labels)
+
+
+def marginal_levels(m, levels=None):
+    """
+    Returns all separated systems of m (a SystemLattice e.g. Marginals or
+    ProbMarginals) as a list where element k lists the (k+1)-partite systems,
+    in the order given by separate_order
+    If levels is given, only the systems of up to levels parties are computed
+    """
+    # Compute largest systems first so each system is computed from one
+    # that is a single subsystem larger
+    order = separate_order(m.q)[:levels]
+    separated = [None] * len(order)
+    for k in range(len(order) - 1, -1, -1):
+        separated[k] = [m[labels] for labels in order[k]]
+    return separated
+
+
+def subsystem_positions(labels):
+    """
+    Converts subsystem labels e.g. 'AC' (or list of positions e.g. [0, 2])
+    to a sorted tuple of subsystem positions e.g. (0, 2)
+    """
+    if(isinstance(labels, str)):
+        return tuple(sorted(set(ord(l) - ord('A') for l in labels.upper())))
+    return tuple(sorted(set(int(l) for l in labels)))
+
+
+def system_mask(labels):
+    """
+    Converts subsystem labels e.g. 'AC' (or list of positions e.g. [0, 2])
+    to a bitmask e.g. 0b101
+    """
+    mask = 0
+    for i in subsystem_positions(labels):
+        mask |= 1 << i
+    return mask
+
+
+def mask_positions(mask):
+    """
+    Converts bitmask e.g. 0b101 to a tuple of subsystem positions e.g. (0, 2)
+    """
+    positions = []
+    i = 0
+    while(mask >> i):
+        if((mask >> i) & 1):
+            positions.append(i)
+        i += 1
+    return tuple(positions)
+
+
+def mask_labels(mask):
+    """
+    Converts bitmask e.g. 0b101 to subsystem labels e.g. 'AC'
+    """
+    return ''.join(chr(ord('A') + i) for i in mask_positions(mask))
+
+
+def vector_labels(q):
+    """
+    Returns labels of all 2^q - 1 systems of a q-partite system in bitmask
+    order, which is the order of the entries of an entropy vector
+    e.g. vector_labels(3) = ['A', 'B', 'AB', 'C', 'AC', 'BC', 'ABC'], so the
+    entropy of system labels is entry system_mask(labels) - 1
+    """
+    return [mask_labels(mask) for mask in range(1, 1 << q)]
+
+
+class SystemLattice(object):
+    """
+    Systems (or joint distributions) of a q-partite system computed on
+    demand and stored by bitmask (see system_mask). Each system is computed
+    once, from the cheapest system already stored that contains it (see
+    parent_cost), by subclasses' trace(parent, positions, traced): parent is
+    the stored system of subsystems positions, and traced lists the indices
+    into positions to remove. Used by Marginals (partial_trace.py),
+    ProbMarginals (separate_probs.py) and SparseProbs (sparse_probs.py)
+    dims is the dimension (number of outcomes) of each subsystem
+    """
+
+    # Named in error messages
+    func_str = "get_mask in utils.py"
+
+    def __init__(self, dims):
+        self.dims = list(dims)
+        self.q = len(self.dims)
+        self.full = (1 << self.q) - 1
+        self.systems = {}
+        # Sizes computed by mask_size, stored by bitmask
+        self.sizes = {}
+
+    def __getitem__(self, labels):
+        return self.get(labels)
+
+    def __contains__(self, labels):
+        return system_mask(labels) in self.systems
+
+    def size(self, labels):
+        """
+        Returns the product of the dimensions of the subsystems labels
+        """
+        return self.mask_size(system_mask(labels))
+
+    def mask_size(self, mask):
+        if(mask not in self.sizes):
+            size = 1
+            for i in mask_positions(mask):
+                size *= self.dims[i]
+            self.sizes[mask] = size
+        return self.sizes[mask]
+
+    def parent_cost(self, mask):
+        """
+        Cost of computing a system from stored system mask
+        """
+        return self.mask_size(mask)
+
+    def get(self, labels):
+        """
+        Returns the system with the given labels
+        """
+        return self.get_mask(system_mask(labels))
+
+    def get_mask(self, mask):
+        """
+        Returns the system with the given bitmask
+        """
+        if(mask in self.systems):
+            return self.systems[mask]
+
+        if(mask <= 0 or (mask & self.full) != mask):
+            print("Error in Function '" + self.func_str + "':")
+            print("Subsystems " + mask_labels(mask) + " not in a " + str(self.q) + "-partite system")
+            sys.exit()
+
+        sub = self.compute_mask(mask)
+        self.systems[mask] = sub
+        return sub
+
+    def compute_mask(self, mask):
+        """
+        Computes the system with the given bitmask from the cheapest stored
+        system that contains it
+        """
+        parents = [s for s in self.systems if (s & mask) == mask]
+        parent = min(parents, key=self.parent_cost)
+
+        positions = mask_positions(parent)
+        traced = [i for i, s in enumerate(positions) if not (mask >> s) & 1]
+        return self.trace(self.systems[parent], positions, traced)
+
+
+# Linear information inequalities written as coefficient vectors over entropy
+# vectors (see vector_labels): an inequality holds for a state if the dot
+# product of its coefficients with the state's entropy vector is >= 0
+
+def entropy_coefficients(q, labels):
+    """
+    Returns coefficient vector of entropy S(labels) of a q-partite system
+    The entropy of no systems (labels = '') is 0 so has no coefficients
+    """
+    c = np.zeros((1 << q) - 1)
+    mask = system_mask(labels)
+    if(mask):
+        c[mask - 1] = 1
+    return c
+
+
+def mutual_info_coefficients(q, A, B, C=''):
+    """
+    Returns coefficient vector of I(A:B|C) = S(A,C) + S(B,C) - S(C) - S(A,B,C)
+    of a q-partite system, which is I(A:B) if C is not given
+    """
+    return (entropy_coefficients(q, A + C) + entropy_coefficients(q, B + C)
+            - entropy_coefficients(q, C) - entropy_coefficients(q, A + B + C))
+
+
+def inequality_coefficients(q, terms):
+    """
+    Returns coefficient vector of the sum of mutual informations in terms,
+    a list of (coefficient, A, B, C) for coefficient * I(A:B|C) e.g.
+    [(1, 'A', 'B', ''), (-2, 'C', 'D', 'A')] is I(A:B) - 2I(C:D|A)
+    """
+    c = np.zeros((1 << q) - 1)
+    for coefficient, A, B, C in terms:
+        c += coefficient * mutual_info_coefficients(q, A, B, C)
+    return c
+
+
+# Non shannon-type inequalities of 4 systems (Theorem II.2 and III.1 - III.6
+# of the paper in non_shannon_quantum.py) as RHS - LHS >= 0, in the order of
+# non_shannon_1 ... non_shannon_7
+non_shannon_terms = [
+    # 2I(C:D) <= I(A:B) + I(A:C,D) + 3I(C:D|A) + I(C:D|B)
+    [(-2, 'C', 'D', ''), (1, 'A', 'B', ''), (1, 'A', 'CD', ''),
+     (3, 'C', 'D', 'A'), (1, 'C', 'D', 'B')],
+    # 2I(A:B) <= 3I(A:B|C) + 3I(A:C|B) + 3I(B:C|A) + 2I(A:D) +2I(B:C|D)
+    [(-2, 'A', 'B', ''), (3, 'A', 'B', 'C'), (3, 'A', 'C', 'B'),
+     (3, 'B', 'C', 'A'), (2, 'A', 'D', ''), (2, 'B', 'C', 'D')],
+    # 2I(A:B) <= 4I(A:B|C) + I(A:C|B) + 2I(B:C|A) + 3I(A:B|D) + I(B:D|A) + 2I(C:D)
+    [(-2, 'A', 'B', ''), (4, 'A', 'B', 'C'), (1, 'A', 'C', 'B'),
+     (2, 'B', 'C', 'A'), (3, 'A', 'B', 'D'), (1, 'B', 'D', 'A'),
+     (2, 'C', 'D', '')],
+    # 2I(A:B) <= 3I(A:B|C) + 2I(A:C|B) + 4I(B:C|A) + 2I(A:C|D) + I(A:D|C) +
+    # 2I(B:D) + I(C:D|A)
+    [(-2, 'A', 'B', ''), (3, 'A', 'B', 'C'), (2, 'A', 'C', 'B'),
+     (4, 'B', 'C', 'A'), (2, 'A', 'C', 'D'), (1, 'A', 'D', 'C'),
+     (2, 'B', 'D', ''), (1, 'C', 'D', 'A')],
+    # 2I(A:B) <= 5I(A:B|C) + 3I(A:C|B) + I(B:C|A) + 2I(A:D) + 2I(B:C|D)
+    [(-2, 'A', 'B', ''), (5, 'A', 'B', 'C'), (3, 'A', 'C', 'B'),
+     (1, 'B', 'C', 'A'), (2, 'A', 'D', ''), (2, 'B', 'C', 'D')],
+    # 2I(A:B) <= 4I(A:B|C) + 4I(A:C|B) + I(B:C|A) + 2I(A:D) + 2I(B:C|D) + I(C:D|B)
+    # (as computed by non_shannon_6 and new_eq6_s)
+    [(-2, 'A', 'B', ''), (4, 'A', 'B', 'C'), (4, 'A', 'C', 'B'),
+     (1, 'B', 'C', 'A'), (2, 'A', 'D', ''), (2, 'B', 'C', 'D'),
+     (1, 'C', 'D', 'B')],
+    # 2I(A:B) <= 3I(A:B|C) + 2I(A:C|B) + 2I(B:C|A) + 2I(A:B|D) + I(A:D|B) +
+    # I(B:D|A) + 2I(C:D)
+    [(-2, 'A', 'B', ''), (3, 'A', 'B', 'C'), (2, 'A', 'C', 'B'),
+     (2, 'B', 'C', 'A'), (2, 'A', 'B', 'D'), (1, 'A', 'D', 'B'),
+     (1, 'B', 'D', 'A'), (2, 'C', 'D', '')],
+]
+
+
+def non_shannon_matrix():
+    """
+    Returns 7 x 15 matrix whose rows are the coefficient vectors of the non
+    shannon-type inequalities in non_shannon_terms
+    """
+    return np.array([inequality_coefficients(4, terms) for terms in non_shannon_terms])
+
+
+def inequality_slack(entropies, coefficients):
+    """
+    entropies: entropy vector, or (n_states x 2^q - 1) matrix of entropy
+    vectors. coefficients: coefficient vector, or (n_ineq x 2^q - 1) matrix
+    of coefficient vectors
+    Returns RHS - LHS of every inequality for every state, in one matrix
+    multiply i.e. (n_states x n_ineq) matrix. Inequality holds if >= 0
+    """
+    return np.matmul(entropies, np.transpose(coefficients))